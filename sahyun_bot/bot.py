@@ -2,6 +2,7 @@
 Main module of the application. Launches the bot, begins listening to commands and executing them.
 """
 from sahyun_bot.modules import *
+from sahyun_bot.utils import load_public_suffixes
 from sahyun_bot.utils_bot import setup_console
 from sahyun_bot.utils_elastic import setup_elastic
 from sahyun_bot.utils_logging import get_logger
@@ -11,7 +12,9 @@ LOG = get_logger('bot')  # __name__ becomes main
 
 def run_main():
     LOG.warning('Launching bot...')
+    load_public_suffixes()
     setup_elastic(us, tl)
+    ai.start()
     bot.launch_in_own_thread()
     setup_console(tc)
     print_error_warning()
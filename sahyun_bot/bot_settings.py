@@ -7,6 +7,7 @@ import logging.config
 from sahyun_bot import elastic_settings
 from sahyun_bot.customsforge_settings import *
 from sahyun_bot.irc_bot_settings import *
+from sahyun_bot.utils_session import DEFAULT_POOL_SIZE, DEFAULT_IDLE_SECONDS, DEFAULT_CASSETTE_DIR
 from sahyun_bot.utils_settings import config, read_config, parse_bool
 
 config.read('config.ini')
@@ -19,13 +20,27 @@ logging.info('---------------------------------------------------------')
 
 s_debug = read_config('system', 'HttpDebugMode', convert=parse_bool, fallback=False)
 http.client.HTTPConnection.debuglevel = 1 if s_debug else 0
+s_pool = read_config('system', 'SessionPoolSize', convert=int, fallback=DEFAULT_POOL_SIZE)
+s_idle = read_config('system', 'SessionIdleTimeout', convert=int, fallback=DEFAULT_IDLE_SECONDS)
+s_cassette = read_config('system', 'CassetteMode', convert=str.lower)
+s_cassette_dir = read_config('system', 'CassetteDirectory', fallback=DEFAULT_CASSETTE_DIR)
+s_latency = read_config('system', 'CassetteLatency', convert=float, fallback=0.0)
 
 c_email = read_config('customsforge', 'Email')
 c_pass = read_config('customsforge', 'Password')
 c_batch = read_config('customsforge', 'BatchSize', convert=int, fallback=DEFAULT_BATCH_SIZE)
+c_adaptive = read_config('customsforge', 'AdaptiveBatch', convert=parse_bool, fallback=False)
+c_min_batch = read_config('customsforge', 'MinBatchSize', convert=int, fallback=DEFAULT_MIN_BATCH_SIZE)
+c_latency = read_config('customsforge', 'TargetLatency', convert=float, fallback=DEFAULT_TARGET_LATENCY)
 c_timeout = read_config('customsforge', 'Timeout', convert=int, fallback=DEFAULT_TIMEOUT)
+c_parallel = read_config('customsforge', 'ParallelPages', convert=int, fallback=DEFAULT_PARALLEL_PAGES)
+c_retries = read_config('customsforge', 'PageRetries', convert=int, fallback=DEFAULT_PAGE_RETRIES)
+c_backoff = read_config('customsforge', 'PageBackoff', convert=float, fallback=DEFAULT_PAGE_BACKOFF)
+c_failed = read_config('customsforge', 'MaxFailedPages', convert=int, fallback=DEFAULT_MAX_FAILED_PAGES)
 c_jar = read_config('customsforge', 'CookieFilename', fallback=DEFAULT_COOKIE_FILE, allow_empty=True)
 c_jar = DEFAULT_COOKIE_FILE if c_jar == TEST_COOKIE_FILE else c_jar
+c_checkpoint = read_config('customsforge', 'CheckpointFilename', fallback=DEFAULT_CHECKPOINT_FILE, allow_empty=True)
+c_prints = read_config('customsforge', 'FingerprintFilename', fallback=DEFAULT_FINGERPRINT_FILE, allow_empty=True)
 
 i_nick = read_config('irc', 'Nick')
 i_token = read_config('irc', 'Token')
@@ -0,0 +1,269 @@
+"""
+Compact binary snapshot of the CDLC catalog, which can be opened instantly & queried without loading it into memory.
+
+Layout of the file (all numbers are little-endian):
+1) header: magic bytes, format version & amount of CDLCs (n)
+2) ids, sorted ascending: int64[n]
+3) time of update: int64[n]
+4) offset of the CDLC JSON from the start of the record table: uint64[n]
+5) size of the CDLC JSON: uint32[n]
+6) flags (official, platforms, parts): uint32[n]
+7) record table: compact JSON of every CDLC, UTF-8
+
+Every column is in the same order as the ids, so the values of the same CDLC share the position.
+"""
+import json
+import mmap
+import os
+import shutil
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+from tempfile import NamedTemporaryFile, TemporaryFile
+from typing import Optional, Iterator, Iterable, Dict, IO, Tuple
+
+from sahyun_bot.utils import Closeable
+
+SNAPSHOT_MAGIC = b'CDLCSNAP'
+SNAPSHOT_VERSION = 1
+SNAPSHOT_HEADER = struct.Struct('<8sII')
+SNAPSHOT_COLUMNS = (
+    ('q', 8),  # ids
+    ('q', 8),  # time of update
+    ('Q', 8),  # record offset
+    ('I', 4),  # record size
+    ('I', 4),  # flags
+)
+
+FLAG_OFFICIAL = 1 << 0
+PLATFORM_FLAGS = {
+    'pc': 1 << 1,
+    'mac': 1 << 2,
+}
+PART_FLAGS = {
+    'lead': 1 << 3,
+    'rhythm': 1 << 4,
+    'bass': 1 << 5,
+    'vocals': 1 << 6,
+}
+
+
+def flags_of(cdlc: dict) -> int:
+    """
+    :returns flags of given CDLC, as stored in the snapshot
+    """
+    flags = FLAG_OFFICIAL if cdlc.get('is_official', False) else 0
+    for platform in cdlc.get('platforms', None) or []:
+        flags |= PLATFORM_FLAGS.get(platform, 0)
+
+    for part in cdlc.get('parts', None) or []:
+        flags |= PART_FLAGS.get(part, 0)
+
+    return flags
+
+
+def flags_for(platforms: Iterable[str] = (), parts: Iterable[str] = ()) -> int:
+    """
+    :returns flags which CDLCs must have to be playable on all given platforms & have all given parts
+    :raises ValueError if any platform or part is not supported by the snapshot
+    """
+    flags = 0
+    for value, known in [(platform, PLATFORM_FLAGS) for platform in platforms] + [(part, PART_FLAGS) for part in parts]:
+        if value not in known:
+            raise ValueError(f'Snapshot does not support filtering by <{value}>')
+
+        flags |= known[value]
+
+    return flags
+
+
+class SnapshotWriter(Closeable):
+    """
+    Writes CDLCs into a snapshot file. The records are kept in a temporary file while writing, only the columns are
+    kept in memory. The snapshot replaces the file once closed, unless no CDLCs were written at all, or the writer
+    was aborted.
+
+    If the same CDLC is written multiple times, only the copy with the latest time of update is kept.
+    """
+    def __init__(self, file):
+        self.__file = str(file)
+
+        self.__records: Optional[IO] = None
+        self.__positions: Dict[int, int] = {}
+        self.__columns = [array(code) for code, size in SNAPSHOT_COLUMNS]
+
+    def __enter__(self):
+        self.__records = TemporaryFile(prefix='snapshot_')
+        self.__positions = {}
+        self.__columns = [array(code) for code, size in SNAPSHOT_COLUMNS]
+
+    def close(self):
+        if not self.__records:
+            return
+
+        with self.__records:
+            if self.__positions:
+                self.__write_snapshot()
+
+        self.__records = None
+
+    def abort(self):
+        """
+        Discards all CDLCs written so far. The file is not replaced.
+        """
+        if self.__records:
+            self.__records.close()
+
+        self.__records = None
+
+    def write(self, cdlc: dict):
+        cdlc_id = cdlc['id']
+        timestamp = cdlc.get('snapshot_timestamp', 0)
+
+        position = self.__positions.get(cdlc_id, None)
+        ids, timestamps, offsets, sizes, flags = self.__columns
+        if position is not None and timestamps[position] > timestamp:
+            return
+
+        record = json.dumps(cdlc, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+        values = (cdlc_id, timestamp, self.__records.tell(), len(record), flags_of(cdlc))
+        self.__records.write(record)
+
+        if position is None:
+            self.__positions[cdlc_id] = len(ids)
+            for column, value in zip(self.__columns, values):
+                column.append(value)
+        else:
+            for column, value in zip(self.__columns, values):
+                column[position] = value
+
+    def __write_snapshot(self):
+        order = sorted(range(len(self.__columns[0])), key=self.__columns[0].__getitem__)
+
+        directory, name = os.path.split(os.path.abspath(self.__file))
+        with NamedTemporaryFile(mode='wb', dir=directory, prefix=f'{name}_', delete=False) as f:
+            f.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(order)))
+            for (code, size), column in zip(SNAPSHOT_COLUMNS, self.__columns):
+                sorted_column = array(code, (column[i] for i in order))
+                if sys.byteorder != 'little':
+                    sorted_column.byteswap()
+
+                sorted_column.tofile(f)
+
+            self.__records.seek(0)
+            shutil.copyfileobj(self.__records, f)
+
+        os.replace(f.name, self.__file)
+
+
+class CatalogSnapshot(Closeable):
+    """
+    Read-only view of a snapshot file. The file is memory-mapped, so opening it takes the same time regardless of
+    its size, and only the parts which are actually used are ever read.
+
+    CDLCs are found by id using binary search. Filtering by flags only reads the flags column. Only the CDLCs which
+    are actually returned are parsed.
+    """
+    def __init__(self, file):
+        self.__file = str(file)
+
+        with open(self.__file, 'rb') as f:
+            self.__mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        header = self.__mmap.read(SNAPSHOT_HEADER.size).ljust(SNAPSHOT_HEADER.size, b'\0')
+        magic, version, count = SNAPSHOT_HEADER.unpack(header)
+        size = SNAPSHOT_HEADER.size + sum(size for code, size in SNAPSHOT_COLUMNS) * count
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION or len(self.__mmap) < size:
+            self.__mmap.close()
+            raise ValueError(f'File <{self.__file}> is not a CDLC snapshot (version {SNAPSHOT_VERSION})')
+
+        if sys.byteorder != 'little':
+            self.__mmap.close()
+            raise ValueError('CDLC snapshots can only be read on little-endian systems')
+
+        self.__count = count
+        self.__view = memoryview(self.__mmap)
+
+        start = SNAPSHOT_HEADER.size
+        self.__columns = []
+        for code, size in SNAPSHOT_COLUMNS:
+            self.__columns.append(self.__view[start:start + size * count].cast(code))
+            start += size * count
+
+        self.__records = start
+
+    def __len__(self):
+        return self.__count
+
+    def close(self):
+        if self.__mmap.closed:
+            return
+
+        for column in self.__columns:
+            column.release()
+
+        self.__view.release()
+        self.__mmap.close()
+
+    def get(self, cdlc_id: int) -> Optional[dict]:
+        """
+        :returns CDLC with given id, if it is in the snapshot
+        """
+        ids = self.__columns[0]
+        position = bisect_left(ids, cdlc_id)
+        return self.__read(position) if position < self.__count and ids[position] == cdlc_id else None
+
+    def find(self,
+             is_official: Optional[bool] = None,
+             platforms: Iterable[str] = (),
+             parts: Iterable[str] = ()) -> Iterator[int]:
+        """
+        :returns generator of ids of all CDLCs which match the filters, ascending; CDLCs must be playable on every
+        given platform & have every given part; if is_official is None, both official and unofficial CDLCs match
+        :raises ValueError if any platform or part is not supported by the snapshot
+        """
+        required = flags_for(platforms, parts)
+        if is_official:
+            required |= FLAG_OFFICIAL
+
+        forbidden = FLAG_OFFICIAL if is_official is False else 0
+        return self.__find(required, forbidden)
+
+    def __find(self, required: int, forbidden: int) -> Iterator[int]:
+        ids, flags = self.__columns[0], self.__columns[4]
+        for position in range(self.__count):
+            value = flags[position]
+            if value & required == required and not value & forbidden:
+                yield ids[position]
+
+    def timestamp(self, cdlc_id: int) -> Optional[int]:
+        """
+        :returns time of update of CDLC with given id, if it is in the snapshot; does not parse the CDLC
+        """
+        ids = self.__columns[0]
+        position = bisect_left(ids, cdlc_id)
+        return self.__columns[1][position] if position < self.__count and ids[position] == cdlc_id else None
+
+    def read_all(self, since: int = 0) -> Iterator[dict]:
+        """
+        Generates all CDLCs updated at or after given epoch seconds, sorted by time of update, ascending.
+        """
+        timestamps = self.__columns[1]
+        positions = [position for position in range(self.__count) if timestamps[position] >= since]
+        positions.sort(key=lambda position: (timestamps[position], self.__columns[0][position]))
+        for position in positions:
+            yield self.__read(position)
+
+    def versions(self, since: int = 0) -> Iterator[Tuple[int, int]]:
+        """
+        Generates (id, time of update) of all CDLCs updated at or after given epoch seconds, by id; does not parse them
+        """
+        ids, timestamps = self.__columns[0], self.__columns[1]
+        for position in range(self.__count):
+            if timestamps[position] >= since:
+                yield ids[position], timestamps[position]
+
+    def __read(self, position: int) -> dict:
+        offset = self.__records + self.__columns[2][position]
+        return json.loads(self.__view[offset:offset + self.__columns[3][position]].tobytes())
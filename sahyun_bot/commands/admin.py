@@ -6,7 +6,7 @@ Other ADMIN-only commands may still exist in other modules, where they are more
 from typing import Iterator, Tuple
 
 from sahyun_bot.commander_settings import Command, ResponseHook
-from sahyun_bot.the_loaderer import TheLoaderer
+from sahyun_bot.the_loaderer import TheLoaderer, AutoIndex
 from sahyun_bot.users import Users
 from sahyun_bot.users_settings import User, UserRank
 
@@ -29,6 +29,7 @@ class Index(Command):
     def __init__(self, **beans):
         super().__init__(**beans)
         self.__loaderer: TheLoaderer = beans.get('tl', None)
+        self.__auto_index: AutoIndex = beans.get('ai', None)
 
     def is_available(self) -> bool:
         return self.__loaderer is not None and self.__loaderer.use_elastic
@@ -36,11 +37,16 @@ class Index(Command):
     def execute(self, user: User, alias: str, args: str, respond: ResponseHook):
         """
         Tries to index CDLCs from customsforge into elasticsearch.
+        If CDLCs are already being indexed in the background, informs the user instead.
         """
-        has_loaded = self.__loaderer.load()
-        message = '' if has_loaded else ' could not be'
-        respond.to_sender(f'CDLCs{message} indexed')
-        return not has_loaded
+        has_loaded = self.__auto_index.run_now() if self.__auto_index else self.__loaderer.load()
+        if not has_loaded:
+            if self.__auto_index and self.__auto_index.is_running():
+                return respond.to_sender(self.__auto_index.describe())
+
+            return respond.to_sender('CDLCs could not be indexed')
+
+        respond.to_sender(f'CDLCs indexed: {self.__loaderer.stats().summary()}')
 
 
 class Rank(Command):
@@ -1,18 +1,27 @@
+from __future__ import annotations
+
+import hashlib
 import html
+import json
+import os
 import pickle
 import re
+import time
+from collections import deque
+from concurrent.futures.thread import ThreadPoolExecutor
 from datetime import date, datetime, timezone
-from itertools import takewhile
-from threading import RLock
-from typing import Iterator, Optional, Callable, IO, Any, List
+from functools import lru_cache
+from sys import intern
+from threading import RLock, Lock
+from typing import Iterator, Optional, Callable, IO, Any, List, Dict, NamedTuple, Union, Tuple
 
 from requests import Response
 from requests.cookies import RequestsCookieJar
 
 from sahyun_bot.customsforge_settings import *
-from sahyun_bot.utils import T, NON_EXISTENT, identity, debug_ex, clean_link
+from sahyun_bot.utils import T, identity, debug_ex, clean_link, SpillStack
 from sahyun_bot.utils_logging import get_logger
-from sahyun_bot.utils_session import SessionFactory
+from sahyun_bot.utils_session import SessionFactory, SessionPool, Cassette
 from sahyun_bot.utils_settings import parse_bool, parse_list
 
 LOG = get_logger(__name__)
@@ -30,6 +39,12 @@ DOWNLOAD_API = 'https://customsforge.com/process.php?id={}'
 
 EONS_AGO = date.fromisoformat('2010-01-01')  # this should pre-date even the oldest CDLC
 
+KNOWN = 'known'  # CDLCs with this flag were skipped by Fingerprints; they only contain id & snapshot_timestamp
+AFTER_GAP = 'after_gap'  # CDLCs with this flag were updated after some other CDLCs which could not be loaded
+
+CONVERT_ALL = 'all'  # crawl which converts every CDLC
+CONVERT_KNOWN = 'fingerprints'  # crawl which skips CDLCs known to Fingerprints
+
 AJAX_HEADERS = {
     "Accept": "application/json, text/javascript, */*; q=0.01",
     "X-Requested-With": "XMLHttpRequest",
@@ -82,24 +97,61 @@ class CustomsforgeClient:
     To access the API, logging in is required. This is attempted exactly once for every API call that returns
     a redirect indicating lack of (or invalid) credentials. Cookies resulting from login can be stored to avoid
     this process in subsequent executions.
+
+    Paginated API calls request up to 'parallel_pages' pages at the same time. The results are still generated in
+    the order of the pages.
+
+    In adaptive mode, the size of each page is chosen by AdaptiveBatch, between 'min_batch_size' and 'batch_size'.
+
+    Every page is retried up to 'page_retries' times, waiting 'page_backoff' seconds (doubled for every attempt) in
+    between. Pages which still fail are skipped and tried again later. If 'max_failed_pages' fail in a row, the crawl
+    is stopped. See #cdlcs.
+
+    If a checkpoint file is given, crawls through CDLCs can be resumed after failures. See #cdlcs.
     """
     def __init__(self,
                  batch_size: int = DEFAULT_BATCH_SIZE,
                  timeout: int = DEFAULT_TIMEOUT,
+                 parallel_pages: int = DEFAULT_PARALLEL_PAGES,
+                 page_retries: int = DEFAULT_PAGE_RETRIES,
+                 page_backoff: float = DEFAULT_PAGE_BACKOFF,
+                 max_failed_pages: int = DEFAULT_MAX_FAILED_PAGES,
+                 adaptive: bool = False,
+                 min_batch_size: int = DEFAULT_MIN_BATCH_SIZE,
+                 target_latency: float = DEFAULT_TARGET_LATENCY,
                  cookie_jar_file: Optional[str] = DEFAULT_COOKIE_FILE,
+                 checkpoint_file: Optional[str] = None,
                  email: str = None,
                  password: str = None,
-                 get_today: Callable[[], date] = date.today):
+                 get_today: Callable[[], date] = date.today,
+                 session_pool: SessionPool = None,
+                 cassette: Cassette = None):
         self.__batch_size = batch_size if Verify.batch_size(batch_size) else DEFAULT_BATCH_SIZE
         self.__timeout = max(0, timeout) or DEFAULT_TIMEOUT
+        self.__parallel_pages = max(0, parallel_pages) or DEFAULT_PARALLEL_PAGES
+        self.__page_retries = max(0, page_retries)
+        self.__page_backoff = max(0.0, page_backoff)
+        self.__max_failed_pages = max(0, max_failed_pages) or DEFAULT_MAX_FAILED_PAGES
+        self.__adaptive = AdaptiveBatch(minimum=min_batch_size,
+                                        maximum=self.__batch_size,
+                                        target_latency=target_latency) if adaptive else None
         self.__cookie_jar_file = cookie_jar_file
+        self.__checkpoint_file = checkpoint_file
+        self.__checkpoint_locks = {CONVERT_ALL: Lock(), CONVERT_KNOWN: Lock()}
 
         self.__email = email
         self.__password = password
         self.__login_rejected = False
         self.__prevent_multiple_login_lock = RLock()
 
-        self.__sessions = SessionFactory(unsafe=[LOGIN_FORM_PASSWORD])
+        self.__bytes_lock = Lock()
+        self.__bytes_received = 0
+        self.__expected: Optional[int] = None
+
+        self.__sessions = SessionFactory(pool=session_pool,
+                                         max_connections=self.__parallel_pages,
+                                         cassette=cassette,
+                                         unsafe=[LOGIN_FORM_PASSWORD])
         self.__cookies = RequestsCookieJar()
         self.__with_cookie_jar('rb', lambda f: self.__cookies.update(pickle.load(f)))
         # no error, since cookie file probably doesn't exist; we'll try to write it later and log any error then
@@ -121,7 +173,7 @@ class CustomsforgeClient:
             if not self.__has_credentials(email, password):
                 return False
 
-            with self.__sessions.with_retry() as session:
+            with self.__sessions.with_retry(for_url=LOGIN_PAGE) as session:
                 csrf = self.__call('get csrf', session.get, LOGIN_PAGE, cookies=None, try_login=False)
                 if not csrf:  # this indicates an error - repeated attempts may still succeed
                     return False
@@ -154,30 +206,133 @@ class CustomsforgeClient:
             self.__cookies = r.cookies
             return True
 
+    def bytes_received(self) -> int:
+        """
+        :returns total size of all CDLC pages received so far
+        """
+        return self.__bytes_received
+
+    def expected_cdlcs(self) -> Optional[int]:
+        """
+        :returns most CDLCs the latest call to #cdlcs can generate; None until it is known, i.e. the crawl is complete
+        """
+        return self.__expected
+
     def ping(self) -> bool:
         """
         :returns true if a simple call to customsforge succeeded (including login), false otherwise
         """
-        with self.__sessions.with_retry() as session:
+        with self.__sessions.with_retry(for_url=CDLC_API) as session:
             return self.__call('ping', session.get, CDLC_API) is not None
 
-    def cdlcs(self, since: date = EONS_AGO) -> Iterator[dict]:
-        import time
-        epoch_millis = int(time.time() * 1000)
+    def cdlcs(self, since: date = EONS_AGO, fingerprints: Fingerprints = None) -> Iterator[dict]:
+        """
+        Generates all CDLCs updated since given date, ordered by time of update, ascending.
 
-        params = dict(CDLC_API_PARAMS_BASE)
-        params['_'] = epoch_millis
+        The API returns CDLCs starting with the latest update, so all of them must be read before the first one is
+        generated. To avoid keeping the entire catalog in memory, the CDLCs are spilled into a temporary file page by
+        page and read back in reverse.
 
-        with self.__sessions.with_retry() as session:
-            lazy_cdlcs = self.__lazy_all(trying_to='find CDLCs',
-                                         call=session.get,
-                                         url=CDLC_API,
-                                         params=params,
-                                         headers=AJAX_HEADERS,
-                                         convert=To.cdlcs)
+        If checkpoint file is configured, the spilled CDLCs are kept in a file next to it, and the checkpoint records
+        how far the crawl has gone. If the crawl (or reading it back) fails, next call resumes from the checkpoint,
+        as long as it was made for the same or earlier date. Crawls with and without fingerprints use separate files,
+        so they never resume (or discard) each other's progress. The files are deleted once all CDLCs are generated.
+        Only one crawl of each kind can use its files at a time; any others running at the same time start over.
 
+        If some page fails even after retries, it is recorded as a gap and the crawl continues. Gaps are loaded again
+        when the CDLCs are read back, so they are generated in the same order. If a gap still cannot be loaded, all
+        CDLCs updated after it are marked with AFTER_GAP flag, since they are no longer continuous.
+
+        If fingerprints are given, CDLCs which they already know are skipped.
+        """
+        convert = CONVERT_KNOWN if fingerprints is not None else CONVERT_ALL
+        lock = self.__checkpoint_locks[convert]
+        owns_checkpoint = bool(self.__checkpoint_file) and lock.acquire(blocking=False)
+        if self.__checkpoint_file and not owns_checkpoint:
+            LOG.warning('Another customsforge crawl (%s) is in progress. This one cannot be resumed.', convert)
+
+        try:
+            checkpoint_file = f'{self.__checkpoint_file}_{convert}' if owns_checkpoint else None
+            yield from self.__cdlcs(since, fingerprints, convert, checkpoint_file)
+        finally:
+            if owns_checkpoint:
+                lock.release()
+
+    def __cdlcs(self,
+                since: date,
+                fingerprints: Optional[Fingerprints],
+                convert: str,
+                checkpoint_file: Optional[str]) -> Iterator[dict]:
         since_timestamp = int(datetime.combine(since, datetime.min.time(), tzinfo=timezone.utc).timestamp())
-        return reversed(list(takewhile(lambda c: c['snapshot_timestamp'] >= since_timestamp, lazy_cdlcs)))
+        checkpoint = self.__read_checkpoint(checkpoint_file, since, convert)
+        self.__expected = None
+
+        params = dict(CDLC_API_PARAMS_BASE)
+        params['_'] = checkpoint['snapshot']
+
+        stack = SpillStack(chunk_size=self.__batch_size,
+                           file=self.__spill_file(checkpoint_file),
+                           spilled=checkpoint['spilled'])
+        with self.__sessions.with_retry(for_url=CDLC_API) as session, stack:
+            call_params = {
+                'trying_to': 'find CDLCs',
+                'call': session.get,
+                'url': CDLC_API,
+                'params': params,
+                'headers': AJAX_HEADERS,
+                'convert': To.cdlcs if fingerprints is None else fingerprints.cdlcs,
+            }
+
+            if not checkpoint['complete']:
+                offset = checkpoint['offset']
+                pushed = checkpoint.get('pushed', 0)
+                for cdlc in self.__lazy_all(skip=offset, **call_params):
+                    if isinstance(cdlc, Gap):
+                        offset += cdlc.size or 0
+                        pushed += cdlc.size or 0
+                        spilled = stack.push(cdlc)
+                    elif cdlc['snapshot_timestamp'] < since_timestamp:
+                        break
+                    else:
+                        offset += 1
+                        is_new = not cdlc.get(KNOWN, False)
+                        pushed += 1 if is_new else 0
+                        spilled = is_new and stack.push(cdlc)
+
+                    if spilled:
+                        self.__write_checkpoint(checkpoint_file,
+                                                checkpoint,
+                                                offset=offset,
+                                                pushed=pushed,
+                                                spilled=stack.spilled())
+
+                stack.flush()
+                self.__write_checkpoint(checkpoint_file,
+                                        checkpoint,
+                                        offset=offset,
+                                        pushed=pushed,
+                                        spilled=stack.spilled(),
+                                        complete=True)
+
+            self.__expected = checkpoint.get('pushed', None)
+
+            missing = False
+            for item in stack.pop_all():
+                if isinstance(item, Gap):
+                    refilled = self.__refill(item, **call_params)
+                    missing = missing or refilled is None
+                    cdlcs = reversed(refilled or [])
+                else:
+                    cdlcs = [item]
+
+                for cdlc in cdlcs:
+                    if cdlc['snapshot_timestamp'] >= since_timestamp and not cdlc.get(KNOWN, False):
+                        if missing:
+                            cdlc[AFTER_GAP] = True
+
+                        yield cdlc
+
+        self.__remove_checkpoint(checkpoint_file)
 
     def __has_credentials(self, email: str, password: str) -> bool:
         if email and password:
@@ -223,31 +378,180 @@ class CustomsforgeClient:
                    convert: Callable[[Any], Iterator[T]],
                    skip: int = 0,
                    batch: int = None,
-                   **call_params) -> Iterator[T]:
-        batch = batch if Verify.batch_size(batch) else self.__batch_size
+                   **call_params) -> Iterator[Union[T, Gap]]:
+        batch = batch if Verify.batch_size(batch) else None
+        failed_in_a_row = 0
+
+        with ThreadPoolExecutor(self.__parallel_pages) as pool:
+            pages = deque()
+            try:
+                while True:
+                    while len(pages) < self.__parallel_pages:
+                        size = batch or self.__next_batch_size()
+                        pages.append(pool.submit(self.__page_with_retry, convert, skip, size, **call_params))
+                        skip += size
+
+                    page = pages.popleft().result()
+                    if isinstance(page, Gap):
+                        failed_in_a_row += 1
+                        if failed_in_a_row >= self.__max_failed_pages:
+                            LOG.warning('Stopped loading at #%d: %d pages in a row failed.',
+                                        page.start, failed_in_a_row)
+                            yield Gap(page.start, None)
+                            break
+
+                        LOG.warning('Could not load %s. Will try again later.', page)
+                        yield page
+                        continue
+
+                    failed_in_a_row = 0
+                    if not page:
+                        break
+
+                    yield from page
+            finally:
+                for pending in pages:
+                    pending.cancel()
+
+    def __refill(self, gap: Gap, convert: Callable[[Any], Iterator[T]], **call_params) -> Optional[List[T]]:
+        if gap.size is not None:
+            page = self.__page_with_retry(convert, gap.start, gap.size, **call_params)
+            if not isinstance(page, Gap):
+                LOG.warning('Loaded %s on another try.', gap)
+                return page
+
+        LOG.warning('Could not load %s. Anything loaded after will not be continuous.', gap)
+        return None
+
+    def __next_batch_size(self) -> int:
+        return self.__adaptive.next() if self.__adaptive else self.__batch_size
+
+    def __page_with_retry(self,
+                          convert: Callable[[Any], Iterator[T]],
+                          skip: int,
+                          batch: int,
+                          **call_params) -> Union[List[T], Gap]:
+        for attempt in range(self.__page_retries + 1):
+            if attempt:
+                if self.__login_rejected:  # retrying cannot help until new credentials are given
+                    break
+
+                time.sleep(self.__page_backoff * 2 ** (attempt - 1))
+
+            page = self.__page(convert, skip, batch, **call_params)
+            if page is not None:
+                return page
+
+        return Gap(skip, batch)
 
-        while True:
-            params = call_params.setdefault('params', {})
-            params['start'] = skip
-            params['length'] = batch
+    def __page(self,
+               convert: Callable[[Any], Iterator[T]],
+               skip: int,
+               batch: int,
+               **call_params) -> Optional[List[T]]:
+        params = dict(call_params.get('params', {}))
+        params['start'] = skip
+        params['length'] = batch
+        call_params['params'] = params
 
-            r = self.__call(**call_params)
-            if not r or not r.text:
-                break
+        start = time.monotonic()
+        r = self.__call(**call_params)
+        if not r or not r.text:
+            return self.__observe(batch, start)
 
+        with self.__bytes_lock:
+            self.__bytes_received += len(r.content)
+
+        try:
+            page = list(convert(r.json()))
+        except Exception as e:
+            trying_to = call_params['trying_to']
+            debug_ex(e, f'parse response of <{trying_to}> as JSON', LOG)
+            return self.__observe(batch, start)
+
+        return self.__observe(batch, start, len(r.content), page)
+
+    def __observe(self,
+                  batch: int,
+                  start: float,
+                  payload: int = 0,
+                  page: Optional[List[T]] = None) -> Optional[List[T]]:
+        if self.__adaptive and (page is None or len(page) >= batch):  # partial pages are too small to judge
+            self.__adaptive.observe(batch, time.monotonic() - start, payload, page is not None)
+
+        return page
+
+    def __spill_file(self, checkpoint_file: Optional[str]) -> Optional[str]:
+        return f'{checkpoint_file}.spill' if checkpoint_file else None
+
+    def __read_checkpoint(self, checkpoint_file: Optional[str], since: date, convert: str) -> dict:
+        checkpoint = {
+            'since': since.isoformat(),
+            'convert': convert,
+            'snapshot': int(time.time() * 1000),
+            'offset': 0,
+            'pushed': 0,
+            'spilled': [],
+            'complete': False,
+        }
+
+        if not checkpoint_file or not os.path.exists(checkpoint_file):
+            return checkpoint
+
+        try:
+            with open(checkpoint_file, 'r') as f:
+                previous = json.load(f)
+        except Exception as e:
+            debug_ex(e, f'read checkpoint from <{checkpoint_file}>', LOG)
+            return checkpoint
+
+        try:
+            previous_since = date.fromisoformat(previous['since'])
+            spilled = previous['spilled']
+            if spilled and os.path.getsize(self.__spill_file(checkpoint_file)) < spilled[-1]:
+                raise ValueError('Spill file is smaller than checkpoint expects.')
+        except Exception as e:
+            debug_ex(e, f'validate checkpoint from <{checkpoint_file}>', LOG)
+            return checkpoint
+
+        if previous_since > since:
+            LOG.warning('Cannot resume customsforge crawl from %s, since it only goes back to %s.',
+                        since, previous_since)
+            return checkpoint
+
+        # crawls with fingerprints only spill unknown CDLCs, so they cannot be resumed without them & vice versa
+        previous_convert = previous.get('convert', None)
+        if previous_convert != convert:
+            LOG.warning('Cannot resume customsforge crawl (%s), since it was made for a different one (%s).',
+                        convert, previous_convert)
+            return checkpoint
+
+        crawled = datetime.fromtimestamp(previous['snapshot'] / 1000, tz=timezone.utc)
+        LOG.warning('Resuming customsforge crawl from %s at CDLC #%d (%s).',
+                    crawled.isoformat(sep=' ', timespec='seconds'),
+                    previous['offset'],
+                    'complete' if previous['complete'] else 'incomplete')
+        return previous
+
+    def __write_checkpoint(self, checkpoint_file: Optional[str], checkpoint: dict, **progress):
+        checkpoint.update(progress)
+        if checkpoint_file:
             try:
-                it = convert(r.json())
-                first = next(it, NON_EXISTENT)
-                if first is NON_EXISTENT:
-                    break
+                temp_file = f'{checkpoint_file}.tmp'
+                with open(temp_file, 'w') as f:
+                    json.dump(checkpoint, f)
 
-                yield first
-                yield from it
+                os.replace(temp_file, checkpoint_file)
             except Exception as e:
-                trying_to = call_params['trying_to']
-                return debug_ex(e, f'parse response of <{trying_to}> as JSON', LOG)
+                debug_ex(e, f'write checkpoint to <{checkpoint_file}>', LOG)
 
-            skip += batch
+    def __remove_checkpoint(self, checkpoint_file: Optional[str]):
+        for file in filter(None, [checkpoint_file, self.__spill_file(checkpoint_file)]):
+            try:
+                if os.path.exists(file):
+                    os.remove(file)
+            except Exception as e:
+                debug_ex(e, f'remove checkpoint file <{file}>', LOG)
 
     def __with_cookie_jar(self,
                           options: str,
@@ -264,6 +568,177 @@ class CustomsforgeClient:
                     return on_file(f)
 
 
+class Fingerprints:
+    """
+    Remembers pages of CDLCs which were already loaded from customsforge. Thread-safe.
+
+    Every page is identified by a hash of its raw contents, and remembers the id, time of update & hash of every CDLC
+    in it. A page is provably unchanged if its hash is known. A single CDLC is provably unchanged if its hash matches
+    the one remembered for its id. This way unchanged CDLCs are still recognized when new ones shift the pages.
+
+    Provably unchanged CDLCs are not converted. Instead, a stub with only id, snapshot_timestamp & 'known' flag is
+    generated, so that the CDLCs can still be cut off by time of update.
+
+    Pages are only remembered after #commit, which should be called once all CDLCs were loaded successfully.
+    If a file is given, committed pages are stored in it and read back when created again.
+    """
+    def __init__(self, file: Optional[str] = None):
+        self.__file = file
+        self.__lock = RLock()
+
+        self.__pages: Dict[str, List[list]] = {}
+        self.__known: Dict[int, str] = {}
+        self.__pending: Dict[str, List[list]] = {}
+
+        try:
+            if self.__file:
+                with open(self.__file, 'r') as f:
+                    self.__remember(json.load(f))
+        except Exception as e:
+            debug_ex(e, f'read fingerprints from <{self.__file}>', LOG, silent=True)
+
+    def __len__(self) -> int:
+        return len(self.__known)
+
+    def cdlcs(self, page) -> Iterator[dict]:
+        """
+        Same as To.cdlcs, but generates stubs for any CDLCs that are provably unchanged.
+        """
+        if not page:
+            return
+
+        data = page['data']
+        hashes = [fingerprint(cdlc) for cdlc in data]
+        page_hash = hashlib.sha1(''.join(hashes).encode()).hexdigest()
+
+        with self.__lock:
+            known_page = self.__pages.get(page_hash, None)
+
+        if known_page:
+            for cdlc_id, timestamp, cdlc_hash in known_page:
+                yield {'id': cdlc_id, 'snapshot_timestamp': timestamp, KNOWN: True}
+
+            return
+
+        entries = []
+        for c, cdlc_hash in zip(data, hashes):
+            with self.__lock:
+                is_known = self.__known.get(c['id'], None) == cdlc_hash
+
+            cdlc = {'id': c['id'], 'snapshot_timestamp': read_last_update(c), KNOWN: True} if is_known else To.cdlc(c)
+            entries.append([cdlc['id'], cdlc['snapshot_timestamp'], cdlc_hash])
+            yield cdlc
+
+        with self.__lock:
+            self.__pending[page_hash] = entries
+
+    def commit(self):
+        """
+        Remembers all pages seen since last commit (or #forget). Older pages with the same CDLCs are forgotten.
+        """
+        with self.__lock:
+            pages, self.__pending = self.__pending, {}
+            self.__remember(pages)
+
+            try:
+                if self.__file:
+                    with open(self.__file, 'w') as f:
+                        json.dump(self.__pages, f)
+            except Exception as e:
+                debug_ex(e, f'write fingerprints to <{self.__file}>', LOG)
+
+    def forget(self):
+        """
+        Forgets all pages, committed or not. Pages which are stored in a file are only forgotten after next #commit.
+        """
+        with self.__lock:
+            self.__pages = {}
+            self.__known = {}
+            self.__pending = {}
+
+    def __remember(self, pages: Dict[str, List[list]]):
+        new_ids = frozenset(entry[0] for entries in pages.values() for entry in entries)
+        for page_hash, entries in list(self.__pages.items()):
+            if any(entry[0] in new_ids for entry in entries):
+                del self.__pages[page_hash]
+
+        self.__pages.update(pages)
+        self.__known = {cdlc_id: cdlc_hash for entries in self.__pages.values() for cdlc_id, _, cdlc_hash in entries}
+
+
+class Gap(NamedTuple):
+    """
+    Page of values which could not be loaded. If size is None, the gap covers all values after start.
+    """
+    start: int
+    size: Optional[int]
+
+    def __str__(self):
+        return f'values #{self.start}-#{self.start + self.size - 1}' if self.size else f'values from #{self.start}'
+
+
+class AdaptiveBatch:
+    """
+    Chooses the size of pages based on how the previous pages went. Thread-safe.
+
+    After every page, the size is scaled so that the next page should take about 'target_latency' seconds, but it
+    never changes more than twice at once. The size is also limited so that the payload should not exceed
+    'max_payload' bytes. If a page fails, the size is halved instead, and it does not grow while more than
+    'max_error_rate' of recent pages have failed. The size always stays between 'minimum' and 'maximum'.
+    """
+    def __init__(self,
+                 minimum: int,
+                 maximum: int,
+                 target_latency: float = DEFAULT_TARGET_LATENCY,
+                 max_payload: int = DEFAULT_MAX_PAYLOAD,
+                 max_error_rate: float = DEFAULT_MAX_ERROR_RATE):
+        self.__maximum = maximum if Verify.batch_size(maximum) else DEFAULT_BATCH_SIZE
+        self.__minimum = minimum if Verify.batch_size(minimum) else DEFAULT_MIN_BATCH_SIZE
+        self.__minimum = min(self.__minimum, self.__maximum)
+        self.__target_latency = target_latency if target_latency > 0 else DEFAULT_TARGET_LATENCY
+        self.__max_payload = max(0, max_payload) or DEFAULT_MAX_PAYLOAD
+        self.__max_error_rate = max_error_rate
+
+        self.__lock = RLock()
+        self.__size = self.__minimum
+        self.__recent_errors = deque(maxlen=ERROR_RATE_WINDOW)
+
+    def next(self) -> int:
+        """
+        :returns size for the next page
+        """
+        with self.__lock:
+            return self.__size
+
+    def observe(self, size: int, latency: float, payload: int, success: bool):
+        """
+        Adjusts the size for next pages based on the outcome of a page.
+
+        :param size: size of the page that was requested
+        :param latency: seconds it took to get the page
+        :param payload: amount of bytes in the page
+        :param success: true if the page was received & parsed, false otherwise
+        """
+        with self.__lock:
+            self.__recent_errors.append(0 if success else 1)
+            error_rate = sum(self.__recent_errors) / len(self.__recent_errors)
+
+            if not success:
+                new_size = size // 2
+            else:
+                new_size = round(size * self.__target_latency / max(latency, 0.001))
+                new_size = min(new_size, size * 2, self.__max_payload * size // max(payload, 1))
+                new_size = max(new_size, size // 2)
+                if error_rate > self.__max_error_rate:
+                    new_size = min(new_size, size)
+
+            new_size = max(self.__minimum, min(self.__maximum, new_size))
+            if new_size != self.__size:
+                LOG.info('Batch size changed from %d to %d (%d took %.2fs, %d bytes, %.0f%% errors).',
+                         self.__size, new_size, size, latency, payload, error_rate * 100)
+                self.__size = new_size
+
+
 class Verify:
     @staticmethod
     def batch_size(batch_size: int) -> bool:
@@ -281,22 +756,28 @@ class To:
 
     @staticmethod
     def cdlc(c: dict) -> dict:
+        """
+        Converts raw CDLC data into the format used by the application. Every field is only read once.
+        Values which repeat across many CDLCs (artists, authors, tunings) are interned to save memory.
+        """
         cdlc_id = c['id']
+        tunings, parts = read_tunings_and_parts(c)
+        pc_link = read(c, 'file_pc_link')
         return {
             'id': cdlc_id,
-            'artist': read(c['artist'], 'name'),
+            'artist': intern(read(c['artist'], 'name')),
             'title': read(c, 'title'),
             'album': read(c, 'album'),
-            'tuning': read_tunings(c),
+            'tuning': tunings,
             'instrument_info': read_instruments(c),
-            'parts': read_parts(c),
-            'platforms': read_platforms(c),
+            'parts': parts,
+            'platforms': read_platforms(c, pc_link),
             'is_official': read_bool(c, 'is_official'),
 
-            'author': read(c['author'], 'name'),
+            'author': intern(read(c['author'], 'name')),
             'version': read(c, 'version'),
 
-            'direct_download': read(c, 'file_pc_link'),
+            'direct_download': pc_link,
             'download': DOWNLOAD_API.format(cdlc_id),  # no longer works, can be deleted
             'info': CDLC_PAGE.format(cdlc_id),
             'video': read_link(c, 'music_video_url'),
@@ -306,55 +787,89 @@ class To:
         }
 
 
-def read_tunings(cdlc: dict) -> List[str]:
+FINGERPRINT_FIELDS = (
+    'id', 'title', 'album', 'lead', 'rhythm', 'bass', 'alt_lead', 'alt_rhythm', 'alt_bass', 'has_lyrics',
+    'require_capo_lead', 'require_capo_rhythm', 'require_slide_lead', 'require_slide_rhythm', 'require_five_bass',
+    'require_six_bass', 'require_seven_guitar', 'require_twelve_guitar', 'require_heavy_gauge', 'require_whammy_bar',
+    'is_official', 'version', 'file_pc_link', 'file_mac_link', 'music_video_url', 'album_art_url', 'updated_at',
+)
+
+
+def fingerprint(cdlc: dict) -> str:
+    """
+    :returns hash of all the values in raw CDLC data which are used by To.cdlc; others, e.g. downloads, are ignored
+    """
+    values = [cdlc.get(key, None) for key in FINGERPRINT_FIELDS]
+    values.append((cdlc.get('artist', None) or {}).get('name', None))
+    values.append((cdlc.get('author', None) or {}).get('name', None))
+    return hashlib.sha1(json.dumps(values).encode()).hexdigest()
+
+
+CACHED_BOOL_TYPES = frozenset([str, int, bool])
+
+TUNING_PARTS = (
+    ('lead', 'lead'),
+    ('rhythm', 'rhythm'),
+    ('bass', 'bass'),
+    ('alt_lead', 'lead'),
+    ('alt_rhythm', 'rhythm'),
+    ('alt_bass', 'bass'),
+)
+
+INSTRUMENT_INFO = (
+    ('require_capo_lead', 'ii_capolead'),
+    ('require_capo_rhythm', 'ii_caporhythm'),
+    ('require_slide_lead', 'ii_slidelead'),
+    ('require_slide_rhythm', 'ii_sliderhythm'),
+    ('require_five_bass', 'ii_5stringbass'),
+    ('require_six_bass', 'ii_6stringbass'),
+    ('require_seven_guitar', 'ii_7stringguitar'),
+    ('require_twelve_guitar', 'ii_12stringguitar'),
+    ('require_heavy_gauge', 'ii_heavystrings'),
+    ('require_whammy_bar', 'ii_tremolo'),
+)
+
+
+def read_tunings_and_parts(cdlc: dict) -> Tuple[List[str], List[str]]:
     tunings = []
-    for tuning in ['lead', 'rhythm', 'bass', 'alt_lead', 'alt_rhythm', 'alt_bass']:
+    parts = []
+    for tuning, part in TUNING_PARTS:
         value = read(cdlc, tuning)
         if value and not value.isspace() and not value == '0':
-            tunings.append(value)
+            tunings.append(intern(value))
+            parts.append(part)
+
+    read_from_bool(cdlc, 'has_lyrics', 'vocals', parts)
 
-    return tunings
+    return tunings, parts
 
 
 def read_instruments(cdlc: dict) -> List[str]:
     instruments = []
-    read_from_bool(cdlc, 'require_capo_lead', 'ii_capolead', instruments)
-    read_from_bool(cdlc, 'require_capo_rhythm', 'ii_caporhythm', instruments)
-    read_from_bool(cdlc, 'require_slide_lead', 'ii_slidelead', instruments)
-    read_from_bool(cdlc, 'require_slide_rhythm', 'ii_sliderhythm', instruments)
-    read_from_bool(cdlc, 'require_five_bass', 'ii_5stringbass', instruments)
-    read_from_bool(cdlc, 'require_six_bass', 'ii_6stringbass', instruments)
-    read_from_bool(cdlc, 'require_seven_guitar', 'ii_7stringguitar', instruments)
-    read_from_bool(cdlc, 'require_twelve_guitar', 'ii_12stringguitar', instruments)
-    read_from_bool(cdlc, 'require_heavy_gauge', 'ii_heavystrings', instruments)
-    read_from_bool(cdlc, 'require_whammy_bar', 'ii_tremolo', instruments)
-    return instruments
+    for key, value in INSTRUMENT_INFO:
+        read_from_bool(cdlc, key, value, instruments)
 
-
-def read_parts(cdlc: dict) -> List[str]:
-    parts = []
-    for tuning in ['lead', 'rhythm', 'bass', 'alt_lead', 'alt_rhythm', 'alt_bass']:
-        value = read(cdlc, tuning)
-        if value and not value.isspace() and not value == '0':
-            parts.append(tuning.rpartition('alt_')[2])
-
-    read_from_bool(cdlc, 'has_lyrics', 'vocals', parts)
-
-    return parts
+    return instruments
 
 
-def read_platforms(cdlc: dict) -> List[str]:
+def read_platforms(cdlc: dict, pc_link: str) -> List[str]:
     platforms = []
-    for platform in ['pc', 'mac']:  # no mapping for xbox360 and ps3
-        value = read_link(cdlc, f'file_{platform}_link')
-        if value and not value.isspace():
+    for platform, link in [('pc', clean_link(pc_link)), ('mac', read_link(cdlc, 'file_mac_link'))]:  # no xbox360 & ps3
+        if link and not link.isspace():
             platforms.append(platform)
 
     return platforms
 
 
 def read_last_update(cdlc: dict) -> int:
-    value = read(cdlc, 'updated_at')
+    return parse_update(read(cdlc, 'updated_at'))
+
+
+@lru_cache(maxsize=2 ** 12)
+def parse_update(value: str) -> int:
+    """
+    Many CDLCs share the same date of update, so parsed values are cached.
+    """
     update = datetime.strptime(value, '%m/%d/%Y')
     return int(update.replace(tzinfo=timezone.utc).timestamp())
 
@@ -365,8 +880,15 @@ def read_from_bool(data: dict, key: str, value: str, l: List[str]):
 
 
 def read(data: dict, key: str) -> str:
-    value = '' if data[key] is None else str(data[key])
-    return html.unescape(value.strip())
+    return read_value(data[key])
+
+
+def read_value(value: Any) -> str:
+    if value is None:
+        return ''
+
+    value = value.strip() if type(value) is str else str(value).strip()
+    return html.unescape(value) if '&' in value else value
 
 
 def read_all(data: dict, key: str) -> List[str]:
@@ -374,7 +896,16 @@ def read_all(data: dict, key: str) -> List[str]:
 
 
 def read_bool(data: dict, key: str) -> bool:
-    return parse_bool(read(data, key))
+    value = data[key]
+    return to_bool(value) if value is None or type(value) in CACHED_BOOL_TYPES else parse_bool(read_value(value))
+
+
+@lru_cache(maxsize=2 ** 8, typed=True)  # typed, since 1 == True, but str(1) != str(True)
+def to_bool(value: Any) -> bool:
+    """
+    Boolean fields only ever contain a handful of different values, so converted values are cached.
+    """
+    return parse_bool(read_value(value))
 
 
 def read_link(data: dict, key: str) -> str:
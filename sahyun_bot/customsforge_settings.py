@@ -1,4 +1,15 @@
 DEFAULT_BATCH_SIZE = 100
+DEFAULT_MIN_BATCH_SIZE = 10
+DEFAULT_TARGET_LATENCY = 5.0
+DEFAULT_MAX_PAYLOAD = 2 * 2 ** 20
+DEFAULT_MAX_ERROR_RATE = 0.2
+ERROR_RATE_WINDOW = 10
 DEFAULT_TIMEOUT = 100
+DEFAULT_PARALLEL_PAGES = 4
+DEFAULT_PAGE_RETRIES = 2
+DEFAULT_PAGE_BACKOFF = 1.0
+DEFAULT_MAX_FAILED_PAGES = 3
 DEFAULT_COOKIE_FILE = '.cookie_jar'
 TEST_COOKIE_FILE = '.cookie_jar_test'
+DEFAULT_FINGERPRINT_FILE = '.cf_fingerprints'
+DEFAULT_CHECKPOINT_FILE = '.cf_checkpoint'
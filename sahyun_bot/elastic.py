@@ -11,6 +11,7 @@ from elasticsearch_dsl.query import Match, Query, Terms, FunctionScore
 from sahyun_bot import elastic_settings
 from sahyun_bot.elastic_settings import BaseDoc, EpochSecond
 from sahyun_bot.users_settings import UserRank
+from sahyun_bot.utils import registered_domain
 from sahyun_bot.utils_logging import get_logger
 
 elastic_settings.ready_or_die()
@@ -89,6 +90,7 @@ class CustomDLC(BaseDoc):
     version = Keyword(required=True)
 
     direct_download = Keyword()
+    download_domain = Keyword()
     info = Keyword(required=True)
     video = Keyword()
     art = Keyword()
@@ -150,6 +152,12 @@ class CustomDLC(BaseDoc):
         for hit in cls.random_pool(query, *exclude, **kwargs).sort(elastic_settings.RANDOM_SORT)[:1]:
             return hit
 
+    def clean(self):
+        """
+        Derives 'download_domain' from 'direct_download', so domains can be aggregated instead of parsed every time.
+        """
+        self.download_domain = registered_domain(self.direct_download)
+
     def __str__(self) -> str:
         official_str = '(OFFICIAL)' if self.is_official else ''
 
@@ -17,6 +17,7 @@ from sahyun_bot.irc_bot import botyun
 from sahyun_bot.link_job import BrowseLink, CopyLinkToPaste, LinkJobFactory, IgnoreLink
 from sahyun_bot.link_job_properties import *
 from sahyun_bot.the_loaderer import *
+from sahyun_bot.the_loaderer_settings import *
 from sahyun_bot.twitchy import Twitchy
 from sahyun_bot.twitchy_settings import *
 from sahyun_bot.users import Users
@@ -25,6 +26,7 @@ from sahyun_bot.utils import choose
 from sahyun_bot.utils_elastic import print_elastic_indexes
 from sahyun_bot.utils_logging import get_logger
 from sahyun_bot.utils_queue import MemoryQueue
+from sahyun_bot.utils_session import SessionPool, Cassette, CASSETTE_MODES
 
 LOG = get_logger(__name__)
 
@@ -38,15 +40,31 @@ def init_module(module: Any, desc: str):
 
 LOG.warning('Please check config.ini file if any module is unavailable.')
 
+sp = SessionPool(size=s_pool, idle_seconds=s_idle)
+init_module(sp, 'HTTP session pool')
+
+cs = Cassette(mode=s_cassette, directory=s_cassette_dir, latency=s_latency) if s_cassette in CASSETTE_MODES else None
+init_module(cs, f'HTTP cassette ({s_cassette_dir})')
+
 cf = CustomsforgeClient(batch_size=c_batch,
+                        adaptive=c_adaptive,
+                        min_batch_size=c_min_batch,
+                        target_latency=c_latency,
                         timeout=c_timeout,
+                        parallel_pages=c_parallel,
+                        page_retries=c_retries,
+                        page_backoff=c_backoff,
+                        max_failed_pages=c_failed,
                         cookie_jar_file=c_jar,
+                        checkpoint_file=c_checkpoint,
                         email=c_email,
-                        password=c_pass)
+                        password=c_pass,
+                        session_pool=sp,
+                        cassette=cs)
 init_module(cf, 'Customsforge client')
 init_module(c_jar, 'Cookie jar for customsforge')
 
-tw = Twitchy(client_id=t_id, client_secret=t_secret) if t_id and t_secret else None
+tw = Twitchy(client_id=t_id, client_secret=t_secret, session_pool=sp, cassette=cs) if t_id and t_secret else None
 init_module(tw, 'Twitch API')
 
 es = connections.create_connection(hosts=[e_host]) if e_host else None
@@ -60,9 +78,19 @@ init_module(dt, 'Downtime for commands')
 us = Users(streamer=i_streamer, tw=tw, cache_follows=u_cache_f, cache_viewers=u_cache_w)
 init_module(us, 'User factory')
 
-tl = TheLoaderer(cf=cf)
+tl = TheLoaderer(cf=cf,
+                 fingerprint_file=c_prints,
+                 bulk_size=l_bulk_size,
+                 bulk_workers=l_bulk_workers,
+                 scroll_slices=l_slices,
+                 pipeline_size=l_pipeline,
+                 progress_seconds=l_progress,
+                 stats_file=l_stats)
 init_module(tl, 'The loaderer')
 
+ai = AutoIndex(tl=tl, interval_minutes=l_auto_index, jitter=l_auto_jitter)
+init_module(ai, 'Automatic indexing')
+
 lb = BrowseLink()
 lc = CopyLinkToPaste()
 li = IgnoreLink()
@@ -81,7 +109,7 @@ tc_config = {
     'max_pick': cm_pick,
     'max_print': cm_print,
 }
-tc = TheCommander(cf=cf, tw=tw, es=es, dt=dt, us=us, tl=tl, lj=lj, rq=rq, **tc_config)
+tc = TheCommander(cf=cf, tw=tw, es=es, dt=dt, us=us, tl=tl, ai=ai, lj=lj, rq=rq, **tc_config)
 init_module(tc, 'The commander')
 
 bot = botyun(tc=tc,
@@ -12,31 +12,52 @@ It is assumed that the CDLC data inside these is authentic.
 Loading CDLC data manually or through implementations that do not adhere to the contract can ruin the integrity
 of the underlying data by breaking assumptions. For that reason, avoid using bootleg implementations or forged files.
 """
+import gzip
+import io
 import json
 import os
+import random
+import re
 import shutil
+import sqlite3
+import time
 from abc import ABC
+from bisect import bisect_left
+from contextlib import nullcontext, ExitStack
 from datetime import datetime, timezone, date
 from itertools import dropwhile
 from pathlib import Path
-from queue import Queue, Empty
+from queue import Queue, Empty, Full
 from tempfile import NamedTemporaryFile
-from threading import Thread, Event
-from typing import Iterator, Any, IO, List
+from threading import Thread, Event, Lock
+from typing import Iterator, Any, IO, List, Optional, Callable, Tuple, Dict
 
 from elasticsearch import Elasticsearch
-from tldextract import extract
+from elasticsearch.helpers import streaming_bulk, parallel_bulk, BulkIndexError
+from elasticsearch_dsl import ValidationException, Search
+from elasticsearch_dsl.response import Hit
 
-from sahyun_bot.customsforge import CustomsforgeClient, EONS_AGO
+from sahyun_bot import elastic_settings
+from sahyun_bot.catalog import SnapshotWriter, CatalogSnapshot
+
+from sahyun_bot.customsforge import CustomsforgeClient, EONS_AGO, Fingerprints, AFTER_GAP
 from sahyun_bot.elastic import CustomDLC
-from sahyun_bot.utils import debug_ex, Closeable, T
-from sahyun_bot.utils_elastic import ElasticAware
+from sahyun_bot.the_loaderer_settings import *
+from sahyun_bot.utils import debug_ex, Closeable, T, read_json_array, merge_in_threads, registered_domain
+from sahyun_bot.utils_elastic import ElasticAware, PointInTime
 from sahyun_bot.utils_logging import get_logger
 
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
 LOG = get_logger(__name__)
 
 CONTINUOUS_FROM = 'continuous_from'
 
+SNAPSHOT_TIMESTAMP = re.compile(r'"snapshot_timestamp"\s*:\s*(-?\d+)')
+
 CUSTOMSFORGE_STR = frozenset([
     'cf',
     'customsforge',
@@ -49,6 +70,49 @@ ELASTIC_STR = frozenset([
     'elasticindex',
 ])
 
+AUTO_INDEX_NEVER = 'never'
+AUTO_INDEX_RUNNING = 'running'
+AUTO_INDEX_OK = 'ok'
+AUTO_INDEX_FAILED = 'failed'
+AUTO_INDEX_SKIPPED = 'skipped'
+
+IN_ORDER = ('snapshot_timestamp', 'id')  # id breaks ties, so that search_after never skips CDLCs
+
+JSONL_PLAIN = '.jsonl'
+JSONL_GZIP = '.jsonl.gz'
+JSONL_ZSTD = '.jsonl.zst'
+JSONL_EXTENSIONS = (JSONL_PLAIN, JSONL_GZIP, JSONL_ZSTD)
+
+SQLITE_EXTENSIONS = ('.db', '.sqlite')
+SQLITE_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS cdlc (
+    id INTEGER PRIMARY KEY,
+    snapshot_timestamp INTEGER NOT NULL,
+    continuous_from TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS cdlc_snapshot_timestamp ON cdlc (snapshot_timestamp, id);
+'''
+SQLITE_UPSERT = '''
+INSERT INTO cdlc (id, snapshot_timestamp, continuous_from, data) VALUES (?, ?, ?, ?)
+ON CONFLICT (id) DO UPDATE SET
+    snapshot_timestamp = excluded.snapshot_timestamp,
+    continuous_from = excluded.continuous_from,
+    data = excluded.data
+WHERE excluded.snapshot_timestamp >= cdlc.snapshot_timestamp
+'''
+SQLITE_SELECT = '''
+SELECT data, continuous_from FROM cdlc WHERE snapshot_timestamp >= ? ORDER BY snapshot_timestamp, id
+'''
+SQLITE_SELECT_VERSIONS = '''
+SELECT id, snapshot_timestamp FROM cdlc WHERE snapshot_timestamp >= ?
+'''
+SQLITE_SELECT_DIGESTS = '''
+SELECT snapshot_timestamp / ? AS bucket, COUNT(*), SUM(id), SUM(snapshot_timestamp) FROM cdlc GROUP BY bucket
+'''
+
+SNAPSHOT_EXTENSION = '.snap'
+
 
 class Source(Closeable, ABC):
     def read_all(self, since: date = EONS_AGO) -> Iterator[dict]:
@@ -61,6 +125,33 @@ class Source(Closeable, ABC):
         """
         raise NotImplementedError
 
+    def versions(self, since: date = EONS_AGO) -> Iterator[Tuple[int, int]]:
+        """
+        Generates (id, time of update) of all CDLCs since given time of update, in any order. Used for diffs.
+        Sources which can provide these without reading entire CDLCs should override this.
+        """
+        for cdlc in self.read_all(since):
+            yield cdlc['id'], cdlc.get('snapshot_timestamp', 0)
+
+    def digests(self, bucket_seconds: int) -> Optional[Dict[int, Tuple[int, int, int]]]:
+        """
+        :returns same values as bucket_digests for all #versions, if the source can compute them without providing
+        every version; otherwise None, and the versions are read instead. Used for diffs.
+        """
+        return None
+
+    def expected(self) -> Optional[int]:
+        """
+        :returns amount of CDLCs the current #read_all is expected to generate, if known; used to estimate progress
+        """
+        return None
+
+    def bytes_read(self) -> int:
+        """
+        :returns amount of bytes transferred by the current #read_all so far, if the source keeps track of it
+        """
+        return 0
+
 
 class Destination(Closeable, ABC):
     def start_from(self) -> date:
@@ -78,21 +169,63 @@ class Destination(Closeable, ABC):
         """
         raise NotImplementedError
 
+    def max_writers(self) -> int:
+        """
+        :returns amount of threads that can call #try_write at the same time; destinations which rely on the order
+        of writes for continuity should only ever allow one
+        """
+        return 1
+
 
 class Customsforge(Source):
     """
     The prime source for CDLC data. Always continuous.
+
+    Except when some CDLCs could not be loaded. CDLCs updated after them are provided without 'continuous_from'.
+
+    If fingerprints are given, CDLCs which were already loaded before are skipped. Fingerprints are only committed
+    if the context exits without errors and no CDLCs were missing. Reading from the beginning forgets all fingerprints.
     """
-    def __init__(self, cf: CustomsforgeClient):
+    def __init__(self, cf: CustomsforgeClient, fingerprints: Fingerprints = None):
         self.__cf = cf
+        self.__fingerprints = fingerprints
+        self.__missing = False
+        self.__bytes_before = cf.bytes_received()
+
+    def __exit__(self, exc_type, *args):
+        if self.__fingerprints is not None and not exc_type:
+            if self.__missing:
+                LOG.warning('Fingerprints were not updated, because some CDLCs could not be loaded.')
+            else:
+                self.__fingerprints.commit()
+
+        super().__exit__(exc_type, *args)
 
     def read_all(self, since: date = EONS_AGO) -> Iterator[dict]:
         LOG.warning('Loading Customsforge CDLCs from %s.', since)
 
-        for cdlc in self.__cf.cdlcs(since=since):
-            cdlc[CONTINUOUS_FROM] = since
+        if self.__fingerprints is not None:
+            if since <= EONS_AGO:
+                self.__fingerprints.forget()
+
+            LOG.warning('CDLCs that are known to be loaded already will be skipped: %d.', len(self.__fingerprints))
+
+        self.__missing = False
+        self.__bytes_before = self.__cf.bytes_received()
+        for cdlc in self.__cf.cdlcs(since=since, fingerprints=self.__fingerprints):
+            if cdlc.pop(AFTER_GAP, False):
+                self.__missing = True
+            else:
+                cdlc[CONTINUOUS_FROM] = since
+
             yield cdlc
 
+    def expected(self) -> Optional[int]:
+        return self.__cf.expected_cdlcs()
+
+    def bytes_read(self) -> int:
+        return self.__cf.bytes_received() - self.__bytes_before
+
 
 class ElasticIndex(Source, Destination):
     """
@@ -105,47 +238,216 @@ class ElasticIndex(Source, Destination):
     In continuous mode, only continuous documents are provided by the Source API.
     Similarly, Destination API attempts to read documents from the last continuous document, even if more up-to-date
     documents exist that are not continuous (even if they have the flag set!)
+
+    Writes are buffered and sent using bulk API, 'bulk_size' documents per request, with up to 'bulk_workers' requests
+    at the same time. Remaining documents are sent when the index is closed. Every document that fails to be indexed
+    is logged. Since continuity can no longer be guaranteed, all documents written after such failure do not have the
+    flag set, even if they were already indexed. Finally, BulkIndexError is raised when the index is closed.
+
+    Documents are written using 'snapshot_timestamp' as external version, so elastic rejects them if the stored copy
+    is the same or newer. Continuous documents get a slightly higher version, so they can replace a copy of the same
+    CDLC that was not continuous, but not the other way around. Rejected documents are counted as skipped.
+    When the flag is taken away after a failure, the stored version is kept. If a later continuous document is
+    rejected only because its stored copy of the same version lost the flag, the flag is given back.
+
+    Documents are read using 'scroll_slices' slices at the same time, each in a separate thread. In continuous mode,
+    every slice is paged through in order using search_after within a point in time, and the slices are merged so that
+    the order is preserved. Otherwise, slices are scrolled & documents are provided in whatever order they return.
     """
-    def __init__(self, continuous: bool = True):
+    def __init__(self,
+                 continuous: bool = True,
+                 bulk_size: int = DEFAULT_BULK_SIZE,
+                 bulk_workers: int = DEFAULT_BULK_WORKERS,
+                 scroll_slices: int = DEFAULT_SCROLL_SLICES):
         self.__continuous = continuous
+        self.__bulk_size = max(0, bulk_size) or DEFAULT_BULK_SIZE
+        self.__bulk_workers = max(0, bulk_workers) or DEFAULT_BULK_WORKERS
+        self.__scroll_slices = max(0, scroll_slices) or DEFAULT_SCROLL_SLICES
+
+        self.__buffer: List[dict] = []
+        self.__indexed = 0
+        self.__skipped = 0
+        self.__errors: List[dict] = []
 
     def __enter__(self):
         self.__start_from = self.__latest_auto_date() if self.__continuous else None
+        self.__buffer = []
+        self.__indexed = 0
+        self.__skipped = 0
+        self.__errors = []
 
-    def read_all(self, since: date = EONS_AGO) -> Iterator[dict]:
-        LOG.warning('Loading elastic index CDLCs from %s (%s).', date, self.__describe_mode())
+    def close(self):
+        self.__flush()
+        if self.__indexed or self.__skipped or self.__errors:
+            LOG.warning('Indexed %d CDLCs in total, %d skipped as unchanged, %d failed.',
+                        self.__indexed, self.__skipped, len(self.__errors))
 
-        since_timestamp = int(datetime.combine(since, datetime.min.time(), tzinfo=timezone.utc).timestamp())
-        timestamp_range = {'gte': since_timestamp} if since_timestamp else {}
+        if self.__errors:
+            raise BulkIndexError(f'{len(self.__errors)} CDLC(s) failed to index.', self.__errors)
 
-        s = CustomDLC.search()
-        if self.__continuous:
-            s = s.filter('term', from_auto_index=True).sort('snapshot_timestamp').params(preserve_order=True)
-            start_time = int(datetime.combine(self.start_from(), datetime.min.time(), tzinfo=timezone.utc).timestamp())
-            timestamp_range['lte'] = start_time
-
-        if timestamp_range:
-            s = s.filter('range', snapshot_timestamp=timestamp_range)
+    def read_all(self, since: date = EONS_AGO) -> Iterator[dict]:
+        LOG.warning('Loading elastic index CDLCs from %s (%s).', since, self.__describe_mode())
 
-        for hit in s.scan():
+        s = self.__search(since)
+        for hit in self.__scan_in_order(s) if self.__continuous else self.__scan(s):
             cdlc = hit.to_dict()
             cdlc.pop('from_auto_index', None)
+            cdlc.pop('download_domain', None)
             if self.__continuous:
                 cdlc[CONTINUOUS_FROM] = since
 
             yield cdlc
 
+    def versions(self, since: date = EONS_AGO) -> Iterator[Tuple[int, int]]:
+        LOG.warning('Loading elastic index CDLC versions from %s (%s).', since, self.__describe_mode())
+
+        for hit in self.__scan(self.__search(since).source(['id', 'snapshot_timestamp'])):
+            yield hit.id, hit.snapshot_timestamp
+
+    def digests(self, bucket_seconds: int) -> Optional[Dict[int, Tuple[int, int, int]]]:
+        LOG.warning('Computing elastic index CDLC digests (%s).', self.__describe_mode())
+
+        s = self.__search(EONS_AGO)
+        s.aggs.bucket('buckets', 'histogram', field='snapshot_timestamp', interval=bucket_seconds, min_doc_count=1) \
+            .metric('ids', 'sum', field='id') \
+            .metric('timestamps', 'sum', field='snapshot_timestamp')
+
+        response = s[0:0].execute()
+        return {int(b.key) // bucket_seconds: (b.doc_count, int(b.ids.value), int(b.timestamps.value))
+                for b in response.aggregations.buckets.buckets}
+
     def start_from(self) -> date:
         return self.__start_from or EONS_AGO
 
     def try_write(self, cdlc: dict):
         continuous_from = cdlc.pop(CONTINUOUS_FROM, None)
         is_continuous = self.__continuous and continuous_from is not None and continuous_from <= self.start_from()
+        is_continuous = is_continuous and not self.__errors
 
         cdlc_id = cdlc.get('id', None)
         c = CustomDLC(_id=cdlc_id, from_auto_index=is_continuous, **cdlc)
-        c.save()
-        LOG.warning('Indexed CDLC #%s.', cdlc_id)
+        try:
+            c.full_clean()
+        except ValidationException as e:
+            return self.__failed(cdlc_id, {'validation': str(e)})
+
+        action = c.to_dict(include_meta=True)
+        action['_version'] = version(cdlc.get('snapshot_timestamp', 0), is_continuous)
+        action['_version_type'] = 'external'
+
+        self.__buffer.append(action)
+        if len(self.__buffer) >= self.__bulk_size * self.__bulk_workers:
+            self.__flush()
+
+    def __flush(self):
+        actions, self.__buffer = self.__buffer, []
+        if not actions:
+            return
+
+        continuous_after_failure = []
+        continuous_skipped = []
+        for action, (ok, item) in zip(actions, self.__bulk(actions)):
+            is_skipped = not ok and bulk_status(item) == 409
+            if not ok and not is_skipped:
+                self.__failed(action['_id'], item)
+                continue
+
+            if is_skipped:
+                self.__skipped += 1
+            else:
+                self.__indexed += 1
+
+            if self.__errors and (is_skipped or action['_source'].get('from_auto_index', False)):
+                continuous_after_failure.append(action)
+            elif is_skipped and action['_source'].get('from_auto_index', False):
+                continuous_skipped.append(action)
+
+        # the stored copies of these documents may be continuous, even though some documents before them are now missing
+        self.__rewrite(continuous_after_failure, is_stored_continuous, False)
+        # the stored copies of these documents may have lost continuity after a failure, even though they are up-to-date
+        self.__rewrite(continuous_skipped, is_same_but_not_continuous, True)
+
+        LOG.debug('Indexed CDLCs up to #%s.', actions[-1]['_id'])
+
+    def __rewrite(self, actions: List[dict], predicate: Callable[[dict, dict], bool], is_continuous: bool):
+        """
+        Sets the flag of stored copies of given bulk actions, if the predicate matches (stored document, action).
+        The stored version is kept, so the flag can be set back by a later document of the same version.
+        """
+        if not actions:
+            return
+
+        ids = [action['_id'] for action in actions]
+        stored = CustomDLC._get_connection().mget(body={'ids': ids}, index=CustomDLC.index_name(), realtime=True)
+
+        rewrites = [{
+            '_op_type': 'index',
+            '_index': action['_index'],
+            '_id': action['_id'],
+            '_source': dict(doc['_source'], from_auto_index=is_continuous),
+            '_version': doc['_version'],
+            '_version_type': 'external_gte',
+        } for action, doc in zip(actions, stored['docs'])
+            if doc.get('found', False) and predicate(doc, action)]
+
+        for action, (ok, item) in zip(rewrites, self.__bulk(rewrites)):
+            if not ok:
+                self.__failed(action['_id'], item)
+
+    def __bulk(self, actions: List[dict]) -> Iterator[tuple]:
+        if not actions:
+            return iter([])
+
+        params = {
+            'client': CustomDLC._get_connection(),
+            'actions': actions,
+            'chunk_size': self.__bulk_size,
+            'raise_on_error': False,
+            'raise_on_exception': False,
+            'refresh': elastic_settings.e_refresh,
+        }
+
+        if self.__bulk_workers > 1:
+            return parallel_bulk(thread_count=self.__bulk_workers, **params)
+
+        return streaming_bulk(**params)
+
+    def __failed(self, cdlc_id: Any, error: dict):
+        LOG.error('Could not index CDLC #%s: %s', cdlc_id, error)
+        self.__errors.append(error)
+
+    def __search(self, since: date) -> Search:
+        since_timestamp = epoch_seconds(since)
+        timestamp_range = {'gte': since_timestamp} if since_timestamp else {}
+
+        s = CustomDLC.search()
+        if self.__continuous:
+            s = s.filter('term', from_auto_index=True)
+            start_time = epoch_seconds(self.start_from())
+            timestamp_range['lte'] = start_time
+
+        if timestamp_range:
+            s = s.filter('range', snapshot_timestamp=timestamp_range)
+
+        return s
+
+    def __scan(self, s: Search) -> Iterator[Hit]:
+        if self.__scroll_slices <= 1:
+            return s.scan()
+
+        slices = [s.extra(slice={'id': i, 'max': self.__scroll_slices}).scan() for i in range(self.__scroll_slices)]
+        return merge_in_threads(slices, buffer_size=self.__bulk_size)
+
+    def __scan_in_order(self, s: Search) -> Iterator[Hit]:
+        pit = PointInTime(CustomDLC)
+        with pit:
+            if self.__scroll_slices <= 1:
+                yield from pit.scan(s, *IN_ORDER)
+                return
+
+            n = self.__scroll_slices
+            slices = [pit.scan(s, *IN_ORDER, slice_id=i, slices=n) for i in range(n)]
+            yield from merge_in_threads(slices, key=in_order, buffer_size=self.__bulk_size)
 
     def __latest_auto_date(self):
         timestamp = CustomDLC.latest_auto_time()
@@ -155,18 +457,71 @@ class ElasticIndex(Source, Destination):
         return 'only continuous' if self.__continuous else 'both continuous and not'
 
 
+def to_json(o: Any) -> str:
+    """
+    Serializes values which JSON does not support, e.g. 'continuous_from' date.
+    """
+    if isinstance(o, date):
+        return o.isoformat()
+
+    raise TypeError(f'Object of type {type(o).__name__} is not JSON serializable')
+
+
+def in_order(hit: Hit) -> tuple:
+    """
+    :returns sort values of a CDLC hit, same as IN_ORDER
+    """
+    return hit.snapshot_timestamp, hit.id
+
+
+def epoch_seconds(day: date) -> int:
+    """
+    :returns epoch seconds at the start of given day, comparable to 'snapshot_timestamp'
+    """
+    return int(datetime.combine(day, datetime.min.time(), tzinfo=timezone.utc).timestamp())
+
+
+def version(snapshot_timestamp: int, is_continuous: bool) -> int:
+    """
+    :returns external version for a CDLC document; continuous documents win over non-continuous ones of the same age
+    """
+    return snapshot_timestamp * 2 + (1 if is_continuous else 0)
+
+
+def is_stored_continuous(doc: dict, action: dict) -> bool:
+    """
+    :returns true if the stored document is continuous, regardless of the bulk action
+    """
+    return doc['_source'].get('from_auto_index', False)
+
+
+def is_same_but_not_continuous(doc: dict, action: dict) -> bool:
+    """
+    :returns true if the stored document has the same version as the bulk action, but is no longer continuous
+    """
+    return doc['_version'] == action['_version'] and not doc['_source'].get('from_auto_index', False)
+
+
+def bulk_status(item: dict) -> Optional[int]:
+    """
+    :returns HTTP status of a single item in bulk API response
+    """
+    return next(iter(item.values()), {}).get('status', None)
+
+
 class ElasticWeirdness(Destination):
     """
     Special Destination which prints CDLCs which have weird links to the user. Lookup is not performed, as it is
     intended as a review.
     """
+    def max_writers(self) -> int:
+        return DEFAULT_MAX_WRITERS
+
     def try_write(self, cdlc: dict):
         direct_link = cdlc.get('direct_download', None)
-        if direct_link and not direct_link.isspace():
-            domain = extract(direct_link).registered_domain
-            if not domain:
-                cdlc_id = cdlc.get('id', None)
-                LOG.warning('Could not determine the domain for CDLC #%s: <%s>', cdlc_id, direct_link)
+        if direct_link and not direct_link.isspace() and not registered_domain(direct_link):
+            cdlc_id = cdlc.get('id', None)
+            LOG.warning('Could not determine the domain for CDLC #%s: <%s>', cdlc_id, direct_link)
 
 
 class FileDump(Source, Destination):
@@ -178,16 +533,23 @@ class FileDump(Source, Destination):
 
     Preserves the continuity from the source as dumped.
 
+    The file is read one CDLC at a time. Dumps are expected to be sorted by time of update, like the ones written by
+    this class. This is verified before reading, by scanning the timestamps without parsing the CDLCs. Dumps which are
+    not sorted have to be loaded into memory and sorted. Continuity is not preserved for such dumps, since nothing
+    guarantees the CDLCs they contain are complete up to any time of update.
+
+    Writing is done by a separate thread, which takes all CDLCs waiting in the queue (up to 'batch_size') and writes
+    them at once into a buffered temp file. The temp file is copied over the dump when closed.
+
     The file is overwritten during dumping, so be careful to not delete existing dumps, etc.
     """
-    def __init__(self, file, start_from: date = EONS_AGO):
+    def __init__(self, file, start_from: date = EONS_AGO, batch_size: int = DEFAULT_DUMP_BATCH_SIZE):
         self.__file = file
         self.__start_from = start_from
-        self.__contents: List[dict] = []
+        self.__batch_size = max(0, batch_size) or DEFAULT_DUMP_BATCH_SIZE
 
         self.__write_queue = Queue()
         self.__writer = Thread(target=self.__write_from_queue)
-        self.__is_done = Event()
         self.__is_broken = Event()
 
         # the following variables are only accessed in the writer Thread or after join() on it
@@ -195,19 +557,10 @@ class FileDump(Source, Destination):
         self.__first_dump = True
 
     def __enter__(self):
-        try:
-            f = open(self.__file, 'rb')
-        except Exception as e:
-            debug_ex(e, f'read file <{self.__file}>', LOG, silent=True)
-        else:
-            with f:
-                self.__contents = json.load(f)
-                self.__contents.sort(key=lambda c: c.get('snapshot_timestamp', 0))
-
         self.__writer.start()
 
     def close(self):
-        self.__is_done.set()
+        self.__write_queue.put(None)
         self.__writer.join()
 
         if self.__is_broken.is_set():
@@ -233,8 +586,13 @@ class FileDump(Source, Destination):
 
     def read_all(self, since: date = EONS_AGO) -> Iterator[dict]:
         LOG.warning('Loading JSON file CDLCs from %s.', since)
-        since_timestamp = int(datetime.combine(since, datetime.min.time(), tzinfo=timezone.utc).timestamp())
-        yield from dropwhile(lambda c: c.get('snapshot_timestamp', 0) < since_timestamp, self.__contents)
+        since_timestamp = epoch_seconds(since)
+        for cdlc in dropwhile(lambda c: c.get('snapshot_timestamp', 0) < since_timestamp, self.__read_sorted()):
+            continuous_from = cdlc.get(CONTINUOUS_FROM, None)
+            if continuous_from:
+                cdlc[CONTINUOUS_FROM] = date.fromisoformat(continuous_from)
+
+            yield cdlc
 
     def start_from(self) -> date:
         return self.__start_from
@@ -250,53 +608,834 @@ class FileDump(Source, Destination):
         self.__write_queue.put(cdlc)
 
     def __write_from_queue(self):
-        while not self.__is_done.is_set() or not self.__write_queue.empty():
-            try:
-                cdlc = self.__write_queue.get(timeout=1)
-            except Empty:
+        is_done = False
+        while not is_done:
+            batch = [self.__write_queue.get()]
+            while len(batch) < self.__batch_size:
+                try:
+                    batch.append(self.__write_queue.get_nowait())
+                except Empty:
+                    break
+
+            if batch[-1] is None:
+                is_done = True
+                batch.pop()
+
+            if not batch:
                 continue
 
             try:
                 f = self.__get_temp_file()
-                if self.__first_dump:
-                    self.__first_dump = False
-                else:
-                    f.write(',')
-
-                f.write(json.dumps(cdlc, indent=4))
+                separator = '' if self.__first_dump else ','
+                self.__first_dump = False
+                f.write(separator + ','.join(json.dumps(cdlc, indent=4, default=to_json) for cdlc in batch))
             except Exception as e:
                 self.__is_broken.set()
                 debug_ex(e, 'write to temp file', LOG)
                 break
 
+    def __read_sorted(self) -> Iterator[dict]:
+        if not os.path.exists(self.__file):
+            return LOG.debug('JSON file <%s> does not exist.', self.__file)
+
+        if not self.__is_sorted():
+            LOG.warning('JSON file <%s> is not sorted by time of update. Loading it into memory.', self.__file)
+            with open(self.__file, 'r', encoding='utf-8') as f:
+                contents = json.load(f)
+
+            contents.sort(key=lambda c: c.get('snapshot_timestamp', 0))
+            for cdlc in contents:
+                cdlc.pop(CONTINUOUS_FROM, None)
+                yield cdlc
+
+            return
+
+        previous = 0
+        with open(self.__file, 'r', encoding='utf-8') as f:
+            for cdlc in read_json_array(f):
+                timestamp = cdlc.get('snapshot_timestamp', 0)
+                if timestamp < previous:
+                    raise ValueError(f'JSON file <{self.__file}> is not sorted by time of update at CDLC #{cdlc["id"]}')
+
+                previous = timestamp
+                yield cdlc
+
+    def __is_sorted(self) -> bool:
+        """
+        Scans for timestamps without parsing JSON, which is a lot faster. Quotes inside JSON strings are escaped,
+        so only actual keys can match.
+        """
+        previous = 0
+        tail = ''
+        with open(self.__file, 'r', encoding='utf-8') as f:
+            for chunk in iter(lambda: f.read(2 ** 20), ''):
+                text = tail + chunk
+                scanned = 0
+                for match in SNAPSHOT_TIMESTAMP.finditer(text):
+                    if match.end() == len(text):
+                        break  # the number may continue in the next chunk
+
+                    timestamp = int(match.group(1))
+                    if timestamp < previous:
+                        return False
+
+                    previous = timestamp
+                    scanned = match.end()
+
+                tail = text[max(scanned, len(text) - 100):]
+
+        return True
+
     def __get_temp_file(self) -> IO:
         if not self.__temp_dump:
-            self.__temp_dump = NamedTemporaryFile(mode='w', prefix=f'{self.__file}_', suffix='.json', delete=False)
+            self.__temp_dump = NamedTemporaryFile(mode='w',
+                                                  buffering=DUMP_BUFFER_SIZE,
+                                                  prefix=f'{self.__file}_',
+                                                  suffix='.json',
+                                                  delete=False)
             self.__temp_dump.write('[')
 
         return self.__temp_dump
 
 
+class JsonLinesDump(Source, Destination):
+    """
+    File for CDLC dumping (or reading) as JSON Lines, one compact CDLC per line. Files ending with '.jsonl.gz' are
+    compressed with gzip, '.jsonl.zst' with zstd (requires 'zstandard' package).
+
+    Intended for the same purpose as FileDump, but much smaller and faster to read from arbitrary time.
+
+    CDLCs are written in blocks of 'block_size', every block compressed on its own. An index file ('<file>.idx') keeps
+    the time of update of the first CDLC in every block and where the block starts in the file. When reading, blocks
+    which only contain CDLCs updated before the requested time are skipped without being read at all.
+
+    Preserves the continuity from the source as dumped. Dumps without a matching index, or which were not written
+    sorted by time of update, have to be loaded into memory and sorted.
+
+    The file and its index are overwritten during dumping, so be careful to not delete existing dumps, etc.
+    """
+    def __init__(self, file, start_from: date = EONS_AGO, block_size: int = DEFAULT_DUMP_BLOCK_SIZE):
+        self.__file = str(file)
+        self.__index_file = f'{self.__file}.idx'
+        self.__start_from = start_from
+        self.__block_size = max(0, block_size) or DEFAULT_DUMP_BLOCK_SIZE
+
+        self.__extension = next((e for e in reversed(JSONL_EXTENSIONS) if self.__file.lower().endswith(e)), JSONL_PLAIN)
+        if self.__extension == JSONL_ZSTD and not zstandard:
+            raise ValueError(f'Package "zstandard" is required for <{self.__file}>')
+
+        self.__temp_dump = None
+        self.__block: List[bytes] = []
+        self.__blocks: List[list] = []
+        self.__is_sorted = True
+        self.__previous = 0
+
+    def __enter__(self):
+        self.__temp_dump = None
+        self.__block = []
+        self.__blocks = []
+        self.__is_sorted = True
+        self.__previous = 0
+
+    def close(self):
+        try:
+            self.__write_block()
+        except Exception as e:
+            LOG.error('An error occurred while trying to write to temp file.')
+            debug_ex(e, 'write to temp file', LOG, silent=True)
+
+        if not self.__temp_dump:
+            return
+
+        try:
+            self.__temp_dump.close()
+            index = {
+                'size': os.path.getsize(self.__temp_dump.name),
+                'sorted': self.__is_sorted,
+                'blocks': self.__blocks,
+            }
+            with open(self.__temp_dump.name + '.idx', 'w', encoding='utf-8') as f:
+                json.dump(index, f)
+
+            os.replace(self.__temp_dump.name, self.__file)
+            os.replace(self.__temp_dump.name + '.idx', self.__index_file)
+            LOG.warning('CDLC JSON lines dump file ready: %s.', self.__file)
+        except Exception as e:
+            LOG.error('Writing to file <%s> failed. Please check temp file if it still exists: %s',
+                      self.__file, self.__temp_dump.name)
+            return debug_ex(e, f'write from temp to file <{self.__file}>', LOG, silent=True)
+
+    def read_all(self, since: date = EONS_AGO) -> Iterator[dict]:
+        LOG.warning('Loading JSON lines file CDLCs from %s.', since)
+        since_timestamp = epoch_seconds(since)
+        cdlcs = self.__read_sorted(since_timestamp)
+        for cdlc in dropwhile(lambda c: c.get('snapshot_timestamp', 0) < since_timestamp, cdlcs):
+            continuous_from = cdlc.get(CONTINUOUS_FROM, None)
+            if continuous_from:
+                cdlc[CONTINUOUS_FROM] = date.fromisoformat(continuous_from)
+
+            yield cdlc
+
+    def start_from(self) -> date:
+        return self.__start_from
+
+    def try_write(self, cdlc: dict):
+        direct_link = cdlc.get('direct_download', '')
+        if not direct_link or direct_link.isspace():
+            return
+
+        timestamp = cdlc.get('snapshot_timestamp', 0)
+        if timestamp < self.__previous:
+            self.__is_sorted = False
+
+        self.__previous = timestamp
+        if not self.__block:
+            self.__blocks.append([timestamp, None])
+
+        line = json.dumps(cdlc, separators=(',', ':'), ensure_ascii=False, default=to_json)
+        self.__block.append(line.encode('utf-8'))
+        if len(self.__block) >= self.__block_size:
+            self.__write_block()
+
+    def __write_block(self):
+        if not self.__block:
+            return
+
+        if not self.__temp_dump:
+            directory, name = os.path.split(os.path.abspath(self.__file))
+            self.__temp_dump = NamedTemporaryFile(mode='wb', dir=directory, prefix=f'{name}_', delete=False)
+
+        self.__blocks[-1][1] = self.__temp_dump.tell()
+        self.__temp_dump.write(self.__compress(b'\n'.join(self.__block) + b'\n'))
+        self.__block = []
+
+    def __compress(self, data: bytes) -> bytes:
+        if self.__extension == JSONL_GZIP:
+            return gzip.compress(data, compresslevel=6)
+
+        if self.__extension == JSONL_ZSTD:
+            return zstandard.ZstdCompressor().compress(data)
+
+        return data
+
+    def __read_sorted(self, since_timestamp: int) -> Iterator[dict]:
+        if not os.path.exists(self.__file):
+            return LOG.debug('JSON lines file <%s> does not exist.', self.__file)
+
+        index = self.__read_index()
+        if not index or not index['sorted']:
+            LOG.warning('JSON lines file <%s> is not indexed & sorted by time of update. Loading it into memory.',
+                        self.__file)
+            contents = list(self.__read_from(0))
+            contents.sort(key=lambda c: c.get('snapshot_timestamp', 0))
+            yield from contents
+            return
+
+        blocks = index['blocks']
+        # the block before the first one which starts at given time can still contain CDLCs from that time
+        start = max(0, bisect_left([timestamp for timestamp, offset in blocks], since_timestamp) - 1)
+        yield from self.__read_from(blocks[start][1] if blocks else 0)
+
+    def __read_index(self) -> Optional[dict]:
+        try:
+            with open(self.__index_file, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            return debug_ex(e, f'read index file <{self.__index_file}>', LOG, silent=True)
+
+        if index.get('size', None) != os.path.getsize(self.__file):
+            return LOG.warning('Index file <%s> does not match its dump. Ignoring it.', self.__index_file)
+
+        return index
+
+    def __read_from(self, offset: int) -> Iterator[dict]:
+        with open(self.__file, 'rb') as f:
+            f.seek(offset)
+            with self.__decompress(f) as lines:
+                for line in lines:
+                    if line.strip():
+                        yield json.loads(line)
+
+    def __decompress(self, f: IO):
+        if self.__extension == JSONL_GZIP:
+            return gzip.GzipFile(fileobj=f, mode='rb')
+
+        if self.__extension == JSONL_ZSTD:
+            return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(f, read_across_frames=True))
+
+        return nullcontext(f)
+
+
+class SqliteDump(Source, Destination):
+    """
+    SQLite database for CDLC dumping (or reading). Intended as a local mirror of the catalog, which can be read much
+    faster than other sources, e.g. when elastic is not available.
+
+    Every CDLC is stored as a single row, indexed by id and time of update. Reading from arbitrary time is a range
+    query, sorted by time of update.
+
+    Writes are buffered and committed in a single transaction every 'batch_size' CDLCs, and once more when closed.
+    CDLCs that are already stored are replaced, unless the stored copy is newer.
+
+    Preserves the continuity from the source as dumped.
+    """
+    def __init__(self, file, start_from: date = EONS_AGO, batch_size: int = DEFAULT_DUMP_BATCH_SIZE):
+        self.__file = str(file)
+        self.__start_from = start_from
+        self.__batch_size = max(0, batch_size) or DEFAULT_DUMP_BATCH_SIZE
+
+        self.__connection: Optional[sqlite3.Connection] = None
+        self.__buffer: List[tuple] = []
+
+    def __enter__(self):
+        self.__buffer = []
+
+    def close(self):
+        self.__flush()
+        if self.__connection:
+            LOG.warning('CDLCs written into SQLite file %s: %d.', self.__file, self.__connection.total_changes)
+            self.__connection.close()
+            self.__connection = None
+
+    def read_all(self, since: date = EONS_AGO) -> Iterator[dict]:
+        LOG.warning('Loading SQLite file CDLCs from %s.', since)
+        if not os.path.exists(self.__file):
+            return LOG.debug('SQLite file <%s> does not exist.', self.__file)
+
+        connection = sqlite3.connect(self.__file)
+        try:
+            rows = connection.execute(SQLITE_SELECT, (epoch_seconds(since),))
+            for data, continuous_from in rows:
+                cdlc = json.loads(data)
+                if continuous_from:
+                    cdlc[CONTINUOUS_FROM] = date.fromisoformat(continuous_from)
+
+                yield cdlc
+        finally:
+            connection.close()
+
+    def versions(self, since: date = EONS_AGO) -> Iterator[Tuple[int, int]]:
+        LOG.warning('Loading SQLite file CDLC versions from %s.', since)
+        if not os.path.exists(self.__file):
+            return LOG.debug('SQLite file <%s> does not exist.', self.__file)
+
+        connection = sqlite3.connect(self.__file)
+        try:
+            yield from connection.execute(SQLITE_SELECT_VERSIONS, (epoch_seconds(since),))
+        finally:
+            connection.close()
+
+    def digests(self, bucket_seconds: int) -> Optional[Dict[int, Tuple[int, int, int]]]:
+        LOG.warning('Computing SQLite file CDLC digests.')
+        if not os.path.exists(self.__file):
+            return {}
+
+        connection = sqlite3.connect(self.__file)
+        try:
+            return {b: (c, i, t) for b, c, i, t in connection.execute(SQLITE_SELECT_DIGESTS, (bucket_seconds,))}
+        finally:
+            connection.close()
+
+    def start_from(self) -> date:
+        return self.__start_from
+
+    def try_write(self, cdlc: dict):
+        continuous_from = cdlc.pop(CONTINUOUS_FROM, None)
+        data = json.dumps(cdlc, separators=(',', ':'), ensure_ascii=False)
+        row = (cdlc['id'], cdlc.get('snapshot_timestamp', 0), continuous_from.isoformat() if continuous_from else None)
+        self.__buffer.append(row + (data,))
+        if len(self.__buffer) >= self.__batch_size:
+            self.__flush()
+
+    def __flush(self):
+        rows, self.__buffer = self.__buffer, []
+        if not rows:
+            return
+
+        connection = self.__connect()
+        with connection:
+            connection.executemany(SQLITE_UPSERT, rows)
+
+        LOG.debug('Written CDLCs into SQLite file up to #%s.', rows[-1][0])
+
+    def __connect(self) -> sqlite3.Connection:
+        if not self.__connection:
+            # only one thread writes at a time, see #max_writers
+            self.__connection = sqlite3.connect(self.__file, check_same_thread=False)
+            self.__connection.execute('PRAGMA journal_mode=WAL')
+            self.__connection.execute('PRAGMA synchronous=NORMAL')
+            with self.__connection:
+                self.__connection.executescript(SQLITE_SCHEMA)
+
+        return self.__connection
+
+
+class SnapshotDump(Source, Destination):
+    """
+    Memory-mapped snapshot of the catalog. See CatalogSnapshot.
+
+    The snapshot is always written from scratch & replaces the previous one once closed, so the source is always read
+    from the beginning. If loading fails, or nothing is written at all, the previous snapshot is kept as is.
+
+    Continuity is not preserved.
+    """
+    def __init__(self, file):
+        self.__file = str(file)
+
+        self.__stack = ExitStack()
+        self.__writer: Optional[SnapshotWriter] = None
+
+    def __enter__(self):
+        self.__stack = ExitStack()
+        self.__writer = None
+
+    def __exit__(self, exc_type, *args):
+        if exc_type and self.__writer:
+            self.__writer.abort()
+
+        self.close()
+
+    def close(self):
+        self.__writer = None
+        self.__stack.close()
+
+    def read_all(self, since: date = EONS_AGO) -> Iterator[dict]:
+        LOG.warning('Loading snapshot CDLCs from %s.', since)
+        if not os.path.exists(self.__file):
+            return LOG.debug('Snapshot file <%s> does not exist.', self.__file)
+
+        snapshot = CatalogSnapshot(self.__file)
+        with snapshot:
+            yield from snapshot.read_all(epoch_seconds(since))
+
+    def versions(self, since: date = EONS_AGO) -> Iterator[Tuple[int, int]]:
+        LOG.warning('Loading snapshot CDLC versions from %s.', since)
+        if not os.path.exists(self.__file):
+            return LOG.debug('Snapshot file <%s> does not exist.', self.__file)
+
+        snapshot = CatalogSnapshot(self.__file)
+        with snapshot:
+            yield from snapshot.versions(epoch_seconds(since))
+
+    def try_write(self, cdlc: dict):
+        cdlc.pop(CONTINUOUS_FROM, None)
+        if not self.__writer:
+            writer = SnapshotWriter(self.__file)
+            self.__stack.enter_context(writer)
+            self.__writer = writer
+
+        try:
+            self.__writer.write(cdlc)
+        except Exception:
+            self.__writer.abort()
+            raise
+
+
+class FanOut(Destination):
+    """
+    Writes every CDLC into multiple destinations, so that a source only needs to be read once for all of them.
+
+    Reading starts from the earliest date any of the destinations want to start from. Every destination only receives
+    CDLCs updated since its own start, each as a separate copy.
+
+    Destinations are isolated from each other. If one of them fails to write, it is no longer written into, but the
+    others continue as usual. All destinations are closed, even if some fail to. Afterwards, the first error is raised.
+    """
+    def __init__(self, *destinations: Destination):
+        self.__destinations = destinations
+
+        self.__stack = ExitStack()
+        self.__starts: List[int] = []
+        self.__failed_lock = Lock()
+        self.__failed = set()
+        self.__error: Optional[Exception] = None
+
+    def __enter__(self):
+        with ExitStack() as stack:
+            for destination in self.__destinations:
+                stack.enter_context(destination)
+
+            self.__stack = stack.pop_all()
+
+        self.__starts = [epoch_seconds(destination.start_from()) for destination in self.__destinations]
+        self.__failed = set()
+        self.__error = None
+
+    def __exit__(self, *args):
+        self.__stack.__exit__(*args)
+        if self.__error:
+            raise self.__error
+
+    def start_from(self) -> date:
+        return min(destination.start_from() for destination in self.__destinations)
+
+    def max_writers(self) -> int:
+        return min(destination.max_writers() for destination in self.__destinations)
+
+    def try_write(self, cdlc: dict):
+        snapshot_timestamp = cdlc.get('snapshot_timestamp', 0)
+        for i, destination in enumerate(self.__destinations):
+            if snapshot_timestamp >= self.__starts[i] and i not in self.__failed:
+                self.__try_write(i, destination, dict(cdlc))
+
+    def __try_write(self, i: int, destination: Destination, cdlc: dict):
+        try:
+            destination.try_write(cdlc)
+        except Exception as e:
+            with self.__failed_lock:
+                self.__failed.add(i)
+                self.__error = self.__error or e
+
+            LOG.error('Writing into <%s> failed. It will be skipped from now on.', type(destination).__name__)
+            debug_ex(e, f'write CDLC #{cdlc.get("id", None)}', LOG, silent=True)
+
+
+def bucket_digests(versions: Iterator[Tuple[int, int]], bucket_seconds: int) -> Dict[int, Tuple[int, int, int]]:
+    """
+    :returns (amount of CDLCs, sum of ids, sum of times of update) of every bucket of CDLCs by time of update
+    """
+    digests = {}
+    for cdlc_id, timestamp in versions:
+        bucket = timestamp // bucket_seconds
+        count, ids, timestamps = digests.get(bucket, (0, 0, 0))
+        digests[bucket] = count + 1, ids + cdlc_id, timestamps + timestamp
+
+    return digests
+
+
+class SourceDiff:
+    """
+    Differences between two sources, by CDLC id:
+    1) added: in the first source, but not the second
+    2) changed: in both sources, but with different time of update
+    3) missing: in the second source, but not the first
+    """
+    def __init__(self, added: List[int], changed: List[int], missing: List[int], buckets: int, differing: int):
+        self.added = added
+        self.changed = changed
+        self.missing = missing
+        self.buckets = buckets
+        self.differing = differing
+
+    def __bool__(self):
+        return bool(self.added or self.changed or self.missing)
+
+    def summary(self) -> str:
+        """
+        :returns short human readable description of the differences
+        """
+        return f'{len(self.added)} added, {len(self.changed)} changed, {len(self.missing)} missing; ' \
+               f'{self.differing} of {self.buckets} buckets differ'
+
+    @staticmethod
+    def compare(src: Source, dest: Source, bucket_days: int = DEFAULT_DIFF_BUCKET_DAYS) -> 'SourceDiff':
+        """
+        Compares the sources by digests of buckets of CDLCs by time of update. Sources which can compute the digests
+        themselves only provide the versions of CDLCs from the earliest bucket that differs. For other sources, the
+        versions are read once & the digests are computed from them. Only versions in buckets that differ are compared.
+
+        CDLCs are compared by id & time of update only, which sources can often provide without reading entire CDLCs.
+        Digests are sums, so changes which cancel each other out within the same bucket are not noticed.
+        See Source#versions & Source#digests.
+        """
+        bucket_seconds = (max(0, bucket_days) or DEFAULT_DIFF_BUCKET_DAYS) * 24 * 60 * 60
+
+        def digests_of(source: Source) -> Tuple[Dict[int, Tuple[int, int, int]], Optional[Dict[int, int]]]:
+            digests = source.digests(bucket_seconds)
+            if digests is not None:
+                return digests, None
+
+            versions = dict(source.versions())
+            return bucket_digests(iter(versions.items()), bucket_seconds), versions
+
+        src_digests, src_all = digests_of(src)
+        dest_digests, dest_all = digests_of(dest)
+        buckets = src_digests.keys() | dest_digests.keys()
+        differing = {b for b in buckets if src_digests.get(b, None) != dest_digests.get(b, None)}
+        if not differing:
+            return SourceDiff([], [], [], len(buckets), 0)
+
+        since = datetime.fromtimestamp(min(differing) * bucket_seconds, timezone.utc).date()
+
+        def differing_versions(source: Source, versions: Optional[Dict[int, int]]) -> Dict[int, int]:
+            pairs = versions.items() if versions is not None else source.versions(since)
+            return {i: t for i, t in pairs if t // bucket_seconds in differing}
+
+        src_versions = differing_versions(src, src_all)
+        dest_versions = differing_versions(dest, dest_all)
+
+        added = sorted(src_versions.keys() - dest_versions.keys())
+        changed = sorted(i for i in src_versions.keys() & dest_versions.keys() if src_versions[i] != dest_versions[i])
+        missing = sorted(dest_versions.keys() - src_versions.keys())
+        return SourceDiff(added, changed, missing, len(buckets), len(differing))
+
+
+class LoadStats:
+    """
+    Keeps track of loading progress. Thread-safe.
+
+    Counts CDLCs read from the source & written into the destination, as well as the time spent doing each. If the
+    source knows how many bytes it transferred or how many CDLCs it will generate, these are included too. The latter
+    is used to estimate the remaining time.
+
+    Progress is reported at most every 'report_seconds' while loading, and once more when it finishes. If a stats file
+    is given, all values are also written into it as JSON every time they are reported.
+    """
+    def __init__(self,
+                 src: Source = None,
+                 report_seconds: float = DEFAULT_PROGRESS_SECONDS,
+                 stats_file: str = None,
+                 get_time: Callable[[], float] = time.monotonic):
+        self.__src = src
+        self.__report_seconds = max(0.0, report_seconds) or DEFAULT_PROGRESS_SECONDS
+        self.__stats_file = stats_file
+        self.__get_time = get_time
+
+        self.__lock = Lock()
+        self.__started = get_time()
+        self.__last_report = self.__started
+        self.__finished: Optional[float] = None
+        self.__read = 0
+        self.__written = 0
+        self.__reading = 0.0
+        self.__writing = 0.0
+
+    def reading(self, cdlcs: Iterator[dict]) -> Iterator[dict]:
+        """
+        :returns the same CDLCs, counting each of them & how long it took to read
+        """
+        cdlcs = iter(cdlcs)
+        while True:
+            start = self.__get_time()
+            cdlc = next(cdlcs, None)
+            if cdlc is None:
+                return
+
+            with self.__lock:
+                self.__read += 1
+                self.__reading += self.__get_time() - start
+
+            self.__maybe_report()
+            yield cdlc
+
+    def writing(self, write: Callable[[dict], Any], cdlc: dict):
+        """
+        Writes the CDLC, counting it & how long it took to write.
+        """
+        start = self.__get_time()
+        write(cdlc)
+
+        with self.__lock:
+            self.__written += 1
+            self.__writing += self.__get_time() - start
+
+        self.__maybe_report()
+
+    def finish(self):
+        self.__finished = self.__get_time()
+        self.__report()
+
+    def values(self) -> dict:
+        """
+        :returns all tracked values, as written into the stats file
+        """
+        with self.__lock:
+            read, written, reading, writing = self.__read, self.__written, self.__reading, self.__writing
+
+        elapsed = (self.__finished or self.__get_time()) - self.__started
+        expected = self.__src.expected() if self.__src else None
+        remaining = max(0, expected - read) if expected is not None and self.__finished is None else None
+        return {
+            'read': read,
+            'written': written,
+            'bytes_read': self.__src.bytes_read() if self.__src else 0,
+            'expected': expected,
+            'elapsed_seconds': round(elapsed, 3),
+            'source_seconds': round(reading, 3),
+            'destination_seconds': round(writing, 3),
+            'read_per_second': round(read / elapsed, 1) if elapsed > 0 else 0.0,
+            'written_per_second': round(written / elapsed, 1) if elapsed > 0 else 0.0,
+            'eta_seconds': round(remaining * elapsed / read) if remaining is not None and read else None,
+            'finished': self.__finished is not None,
+        }
+
+    def summary(self) -> str:
+        """
+        :returns short human readable description of the progress
+        """
+        v = self.values()
+        transferred = f', {v["bytes_read"] / 2 ** 20:.1f} MiB' if v['bytes_read'] else ''
+        eta = f', ETA {v["eta_seconds"]}s' if v['eta_seconds'] is not None else ''
+        return f'{v["read"]} read ({v["read_per_second"]}/s), {v["written"]} written ({v["written_per_second"]}/s)' \
+               f'{transferred}; {v["elapsed_seconds"]:.0f}s in total, {v["source_seconds"]:.0f}s reading, ' \
+               f'{v["destination_seconds"]:.0f}s writing{eta}'
+
+    def __maybe_report(self):
+        now = self.__get_time()
+        with self.__lock:
+            if now - self.__last_report < self.__report_seconds:
+                return
+
+            self.__last_report = now
+
+        self.__report()
+
+    def __report(self):
+        LOG.warning('%s CDLCs: %s.', 'Loaded' if self.__finished is not None else 'Loading', self.summary())
+        if not self.__stats_file:
+            return
+
+        try:
+            temp_file = f'{self.__stats_file}.tmp'
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump(self.values(), f)
+
+            os.replace(temp_file, self.__stats_file)
+        except Exception as e:
+            debug_ex(e, f'write loading stats into <{self.__stats_file}>', LOG, silent=True)
+
+
+class Pipeline(Closeable):
+    """
+    Moves CDLCs from a source to a destination using separate threads, so that reading and writing can overlap.
+
+    A single thread reads the source and puts the CDLCs into a queue which holds up to 'queue_size' of them. If the
+    destination falls behind, reading waits until there is space in the queue. The queue is emptied by as many threads
+    as the destination allows (see Destination#max_writers).
+
+    If any of the threads fails, all others stop as soon as possible. Closing the pipeline stops all threads & waits
+    for them to finish. Then the first error, if any, is raised again.
+
+    Progress is tracked by given stats, if any. See LoadStats.
+    """
+    def __init__(self,
+                 src: Source,
+                 dest: Destination,
+                 queue_size: int = DEFAULT_PIPELINE_SIZE,
+                 stats: LoadStats = None):
+        self.__src = src
+        self.__dest = dest
+        self.__stats = stats or LoadStats(src)
+
+        self.__queue = Queue(maxsize=max(0, queue_size) or DEFAULT_PIPELINE_SIZE)
+        self.__reader = Thread(target=self.__read, name='loader-reader')
+        self.__writers = [Thread(target=self.__write, name=f'loader-writer-{i}') for i in range(dest.max_writers())]
+
+        self.__is_stopped = Event()
+        self.__error_lock = Lock()
+        self.__error: Optional[BaseException] = None
+
+    def __enter__(self):
+        for thread in [self.__reader] + self.__writers:
+            thread.start()
+
+    def close(self):
+        self.__is_stopped.set()
+        self.join()
+
+        if self.__error:
+            raise self.__error
+
+    def join(self):
+        """
+        Waits until all CDLCs are moved, or some thread fails.
+        """
+        for thread in [self.__reader] + self.__writers:
+            if thread.is_alive():
+                thread.join()
+
+    def __read(self):
+        cdlcs = None
+        try:
+            cdlcs = self.__src.read_all(self.__dest.start_from())
+            for cdlc in self.__stats.reading(cdlcs):
+                if not self.__put(cdlc):
+                    break
+        except BaseException as e:
+            self.__fail(e)
+        finally:
+            try:
+                close = getattr(cdlcs, 'close', None)
+                if close:
+                    close()
+            except BaseException as e:
+                self.__fail(e)
+            finally:
+                for _ in self.__writers:
+                    self.__put(None)
+
+    def __write(self):
+        try:
+            for cdlc in iter(self.__get, None):
+                self.__stats.writing(self.__dest.try_write, cdlc)
+        except BaseException as e:
+            self.__fail(e)
+
+    def __put(self, cdlc: Optional[dict]) -> bool:
+        while not self.__is_stopped.is_set():
+            try:
+                self.__queue.put(cdlc, timeout=1)
+                return True
+            except Full:
+                pass
+
+        return False
+
+    def __get(self) -> Optional[dict]:
+        while not self.__is_stopped.is_set():
+            try:
+                return self.__queue.get(timeout=1)
+            except Empty:
+                pass
+
+        return None
+
+    def __fail(self, e: BaseException):
+        with self.__error_lock:
+            self.__error = self.__error or e
+
+        self.__is_stopped.set()
+        debug_ex(e, 'move CDLCs', LOG, silent=True)
+
+
 class TheLoaderer(ElasticAware):
     def __init__(self,
                  cf: CustomsforgeClient = None,
-                 use_elastic: bool = False):
+                 use_elastic: bool = False,
+                 fingerprint_file: str = None,
+                 bulk_size: int = DEFAULT_BULK_SIZE,
+                 bulk_workers: int = DEFAULT_BULK_WORKERS,
+                 pipeline_size: int = DEFAULT_PIPELINE_SIZE,
+                 progress_seconds: float = DEFAULT_PROGRESS_SECONDS,
+                 stats_file: str = None,
+                 scroll_slices: int = DEFAULT_SCROLL_SLICES):
         super().__init__(use_elastic)
 
+        self.__bulk_size = bulk_size
+        self.__bulk_workers = bulk_workers
+        self.__pipeline_size = pipeline_size
+        self.__progress_seconds = progress_seconds
+        self.__stats_file = stats_file
+        self.__stats: Optional[LoadStats] = None
+        self.__scroll_slices = scroll_slices
+
         self.__cf_source = Customsforge(cf) if cf else None
+        self.__cf_sync = Customsforge(cf, Fingerprints(fingerprint_file)) if cf else None
 
     def log_weird_links(self):
         """
         Logs all weird links in the elastic index to the user.
         """
-        self.load(ElasticIndex(continuous=False), ElasticWeirdness())
+        self.load(ElasticIndex(continuous=False, scroll_slices=self.__scroll_slices), ElasticWeirdness())
 
     def load(self, src=None, dest=None) -> bool:
         """
         Loads CDLCs from a source to a destination.
 
         :param src: Source implementation or an object that can be resolved to one
-        :param dest: Destination implementation or an object that can be resolved to one
+        :param dest: Destination implementation or an object that can be resolved to one; or a list or tuple of them
         :returns true if loading was attempted, false if it failed before even starting
 
         Resolution logic:
@@ -305,28 +1444,78 @@ class TheLoaderer(ElasticAware):
         3) If it's an Elasticsearch, use ElasticIndex
         4) If it's a case-insensitive 'cf' or 'customsforge', use Customsforge
         5) If it's a case-insensitive 'es', 'elastic', 'elasticsearch', 'index' or 'elasticindex', use ElasticIndex
-        6) If it's any other string or path, use FileDump
+        6) If it's any other string or path ending with '.db' or '.sqlite', use SqliteDump
+        7) If it's any other string or path ending with '.snap', use SnapshotDump
+        8) If it's any other string or path ending with '.jsonl', '.jsonl.gz' or '.jsonl.zst', use JsonLinesDump
+        9) If it's any other string or path, use FileDump
 
-        In all cases the resolved instance uses default settings (ElasticIndex in continuous mode, FileDump from 0).
+        In all cases the resolved instance uses default settings (ElasticIndex in continuous mode, dumps from 0).
         Defaults:
         src: Customsforge
         dest: ElasticIndex
 
         In all cases, if src, dest or links is a known implementation that relies on elastic, they will not be used
         when elastic is disabled.
+
+        If both src and dest are defaults, loading is incremental: CDLCs which were already loaded this way and have
+        not changed since are skipped. See Fingerprints.
+
+        If multiple destinations are given, the source is only read once & all of them are written into. See FanOut.
+
+        If pipeline size is positive, reading and writing is done in parallel. See Pipeline.
+
+        Progress is reported while loading. See LoadStats & #stats.
         """
+        if not src and not dest:
+            src = self.__cf_sync
+
         src = self.__coerce_source(src)
         dest = self.__coerce_destination(dest)
 
         if not src or not dest:
             return False
 
-        with src, dest:
-            for cdlc in src.read_all(dest.start_from()):
-                dest.try_write(cdlc)
+        stats = self.__stats = LoadStats(src, report_seconds=self.__progress_seconds, stats_file=self.__stats_file)
+        try:
+            with src, dest:
+                if self.__pipeline_size > 0:
+                    pipeline = Pipeline(src, dest, queue_size=self.__pipeline_size, stats=stats)
+                    with pipeline:
+                        pipeline.join()
+                else:
+                    for cdlc in stats.reading(src.read_all(dest.start_from())):
+                        stats.writing(dest.try_write, cdlc)
+        finally:
+            stats.finish()
 
         return True
 
+    def diff(self, src=None, dest=None, bucket_days: int = DEFAULT_DIFF_BUCKET_DAYS) -> Optional[SourceDiff]:
+        """
+        Compares CDLCs in two sources without loading either of them. See SourceDiff.
+
+        :param src: Source implementation or an object that can be resolved to one, same as #load; default Customsforge
+        :param dest: Source implementation or an object that can be resolved to one, same as #load; default is the
+        entire elastic index
+        :returns differences between the sources, or None if they could not be compared
+        """
+        src = self.__coerce_source(src)
+        dest = self.__coerce_source(dest or ElasticIndex(continuous=False, scroll_slices=self.__scroll_slices))
+        if not src or not dest:
+            return None
+
+        with src, dest:
+            diff = SourceDiff.compare(src, dest, bucket_days=bucket_days)
+
+        LOG.warning('CDLC diff: %s.', diff.summary())
+        return diff
+
+    def stats(self) -> Optional[LoadStats]:
+        """
+        :returns progress of the latest load, if any
+        """
+        return self.__stats
+
     def __coerce_source(self, src) -> Source:
         src = self.__coerce_and_check_elastic(src, self.__cf_source)
         if isinstance(src, Source):
@@ -335,7 +1524,14 @@ class TheLoaderer(ElasticAware):
         return LOG.error('Could not be coerce Source: %s', src)
 
     def __coerce_destination(self, dest) -> Destination:
-        dest = self.__coerce_and_check_elastic(dest, ElasticIndex())
+        if isinstance(dest, (list, tuple)):
+            destinations = [self.__coerce_destination(d) for d in dest]
+            if not destinations or not all(destinations):
+                return LOG.error('Could not be coerce Destinations: %s', dest)
+
+            return destinations[0] if len(destinations) == 1 else FanOut(*destinations)
+
+        dest = self.__coerce_and_check_elastic(dest, self.__elastic_index())
         if isinstance(dest, Destination):
             return dest
 
@@ -349,6 +1545,11 @@ class TheLoaderer(ElasticAware):
 
         return LOG.warning('Cannot use <%s> because elastic is disabled.', coerced_name)
 
+    def __elastic_index(self) -> ElasticIndex:
+        return ElasticIndex(bulk_size=self.__bulk_size,
+                            bulk_workers=self.__bulk_workers,
+                            scroll_slices=self.__scroll_slices)
+
     def __coerce(self, o, fallback: T) -> T:
         if not o:
             return fallback
@@ -357,18 +1558,148 @@ class TheLoaderer(ElasticAware):
             return Customsforge(o)
 
         if isinstance(o, Elasticsearch):
-            return ElasticIndex()
+            return self.__elastic_index()
 
         if isinstance(o, str):
             if o.lower() in CUSTOMSFORGE_STR:
                 return self.__cf_source
 
             if o.lower() in ELASTIC_STR:
-                return ElasticIndex()
+                return self.__elastic_index()
+
+        if isinstance(o, (str, Path)):
+            if str(o).lower().endswith(SQLITE_EXTENSIONS):
+                return SqliteDump(o)
 
-            return FileDump(o)
+            if str(o).lower().endswith(SNAPSHOT_EXTENSION):
+                return SnapshotDump(o)
 
-        if isinstance(o, Path):
-            return FileDump(o)
+            return JsonLinesDump(o) if str(o).lower().endswith(JSONL_EXTENSIONS) else FileDump(o)
 
         return o
+
+
+class AutoIndex(Closeable):
+    """
+    Runs incremental loads (see TheLoaderer#load) in its own thread, every 'interval_minutes'. Every wait is randomly
+    longer or shorter by up to 'jitter' of the interval. If the interval is not positive, loads only run on demand.
+
+    Loads never overlap: if a load is already running, another one is not started. Loads are skipped while elastic
+    is not in use.
+
+    Status of the latest load is available at any time. See #status.
+    """
+    def __init__(self,
+                 tl: TheLoaderer,
+                 interval_minutes: float = 0,
+                 jitter: float = DEFAULT_AUTO_INDEX_JITTER,
+                 get_time: Callable[[], float] = time.time):
+        self.__tl = tl
+        self.__interval = max(0.0, interval_minutes) * 60
+        self.__jitter = min(max(0.0, jitter), 1.0)
+        self.__get_time = get_time
+
+        self.__is_stopped = Event()
+        self.__scheduler: Optional[Thread] = None
+        self.__running = Lock()
+
+        self.__status = AUTO_INDEX_NEVER
+        self.__started: Optional[float] = None
+        self.__finished: Optional[float] = None
+        self.__summary = ''
+
+    def start(self):
+        """
+        Starts loading in the background, unless it is already started or the interval is not positive.
+        """
+        if self.__interval <= 0 or self.__scheduler:
+            return
+
+        self.__scheduler = Thread(target=self.__schedule, name='auto-index', daemon=True)
+        self.__scheduler.start()
+        LOG.warning('CDLCs will be indexed automatically every %.0f minutes.', self.__interval / 60)
+
+    def close(self):
+        self.__is_stopped.set()
+        if self.__scheduler:
+            self.__scheduler.join()
+            self.__scheduler = None
+
+    def run_now(self) -> bool:
+        """
+        Runs a load in the calling thread, unless one is already running.
+
+        :returns true if the load succeeded, false if it failed, was skipped or another one was running
+        """
+        if not self.__running.acquire(blocking=False):
+            LOG.warning('CDLCs are already being indexed since %s.', self.__describe(self.__started))
+            return False
+
+        try:
+            return self.__run()
+        finally:
+            self.__running.release()
+
+    def is_running(self) -> bool:
+        return self.__status == AUTO_INDEX_RUNNING
+
+    def status(self) -> dict:
+        """
+        :returns status of the latest load: when it started & finished (epoch seconds), its outcome & progress
+        """
+        return {
+            'status': self.__status,
+            'started': self.__started,
+            'finished': self.__finished,
+            'summary': self.__summary,
+        }
+
+    def describe(self) -> str:
+        """
+        :returns short human readable status of the latest load
+        """
+        if self.__status == AUTO_INDEX_NEVER:
+            return 'CDLCs have not been indexed yet'
+
+        if self.__status == AUTO_INDEX_RUNNING:
+            return f'CDLCs are being indexed since {self.__describe(self.__started)}'
+
+        summary = f': {self.__summary}' if self.__summary else ''
+        return f'Last indexing {self.__status} at {self.__describe(self.__finished)}{summary}'
+
+    def __schedule(self):
+        while not self.__is_stopped.wait(self.__next_wait()):
+            self.run_now()
+
+    def __next_wait(self) -> float:
+        return self.__interval * (1 + random.uniform(-self.__jitter, self.__jitter))
+
+    def __run(self) -> bool:
+        self.__started = self.__get_time()
+        self.__finished = None
+        self.__summary = ''
+
+        if not self.__tl.use_elastic:
+            LOG.debug('Automatic indexing skipped, because elastic is disabled.')
+            return self.__finish(AUTO_INDEX_SKIPPED)
+
+        self.__status = AUTO_INDEX_RUNNING
+        try:
+            is_loaded = self.__tl.load()
+        except Exception as e:
+            self.__summary = str(e)
+            debug_ex(e, 'index CDLCs', LOG)
+            return self.__finish(AUTO_INDEX_FAILED)
+
+        stats = self.__tl.stats()
+        self.__summary = stats.summary() if stats else ''
+        return self.__finish(AUTO_INDEX_OK if is_loaded else AUTO_INDEX_FAILED)
+
+    def __finish(self, status: str) -> bool:
+        self.__finished = self.__get_time()
+        self.__status = status
+        return status == AUTO_INDEX_OK
+
+    @staticmethod
+    def __describe(timestamp: Optional[float]) -> str:
+        return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(timestamp)) if timestamp else 'unknown'
@@ -0,0 +1,22 @@
+from sahyun_bot.utils_settings import read_config
+
+DEFAULT_BULK_SIZE = 500
+DEFAULT_BULK_WORKERS = 1
+DEFAULT_SCROLL_SLICES = 1
+DEFAULT_PIPELINE_SIZE = 1000
+DEFAULT_MAX_WRITERS = 4
+DEFAULT_DUMP_BLOCK_SIZE = 1000
+DEFAULT_DUMP_BATCH_SIZE = 1000
+DUMP_BUFFER_SIZE = 2 ** 20
+DEFAULT_PROGRESS_SECONDS = 10
+DEFAULT_AUTO_INDEX_JITTER = 0.1
+DEFAULT_DIFF_BUCKET_DAYS = 7
+
+l_bulk_size = read_config('loader', 'BulkSize', convert=int, fallback=DEFAULT_BULK_SIZE)
+l_bulk_workers = read_config('loader', 'BulkWorkers', convert=int, fallback=DEFAULT_BULK_WORKERS)
+l_slices = read_config('loader', 'ScrollSlices', convert=int, fallback=DEFAULT_SCROLL_SLICES)
+l_pipeline = read_config('loader', 'PipelineSize', convert=int, fallback=DEFAULT_PIPELINE_SIZE)
+l_progress = read_config('loader', 'ProgressSeconds', convert=float, fallback=DEFAULT_PROGRESS_SECONDS)
+l_stats = read_config('loader', 'StatsFilename')
+l_auto_index = read_config('loader', 'AutoIndexMinutes', convert=float, fallback=0)
+l_auto_jitter = read_config('loader', 'AutoIndexJitter', convert=float, fallback=DEFAULT_AUTO_INDEX_JITTER)
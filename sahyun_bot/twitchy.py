@@ -7,7 +7,7 @@ from twitch.helix import Follows, User
 
 from sahyun_bot.utils import Closeable, debug_ex, NonelessCache, T
 from sahyun_bot.utils_logging import get_logger
-from sahyun_bot.utils_session import SessionFactory
+from sahyun_bot.utils_session import SessionFactory, SessionPool, Cassette
 
 LOG = get_logger(__name__)
 
@@ -18,11 +18,15 @@ TWITCH_HOSTS_API = 'https://tmi.twitch.tv/hosts?include_logins=1'
 
 
 class Twitchy(Closeable):
-    def __init__(self, client_id: str, client_secret: str):
+    def __init__(self,
+                 client_id: str,
+                 client_secret: str,
+                 session_pool: SessionPool = None,
+                 cassette: Cassette = None):
         self.__client_id = client_id
         self.__client_secret = client_secret
 
-        self.__sessions = SessionFactory(unsafe=['client_secret'])
+        self.__sessions = SessionFactory(pool=session_pool, cassette=cassette, unsafe=['client_secret'])
 
         self.__bearer_token = None
         self.__api = None
@@ -98,7 +102,7 @@ class Twitchy(Closeable):
             'client_secret': self.__client_secret,
         }
 
-        with self.__sessions.with_retry() as session:
+        with self.__sessions.with_retry(for_url=TWITCH_OAUTH2_API) as session:
             result = session.post(TWITCH_OAUTH2_API, params=params)
 
         return result.json().get('access_token')
@@ -111,7 +115,7 @@ class Twitchy(Closeable):
                     'token': self.__bearer_token,
                 }
 
-                with self.__sessions.with_retry() as session:
+                with self.__sessions.with_retry(for_url=TWITCH_REVOKE_API) as session:
                     session.post(TWITCH_REVOKE_API, params=params)
 
     def __call(self, api_call: Callable[..., T], *args, retry_auth: bool = True) -> T:
@@ -140,7 +144,7 @@ class Twitchy(Closeable):
             'target': streamer,
         }
 
-        with self.__sessions.with_retry() as session:
+        with self.__sessions.with_retry(for_url=TWITCH_HOSTS_API) as session:
             result = session.get(TWITCH_HOSTS_API, params=params)
 
         return [host.get('host_login') for host in result.json().get('hosts')]
@@ -2,18 +2,31 @@
 Contains general utilities that can be used in many contexts.
 May also contain utilities that are too few to create a separate module for.
 """
+import heapq
+import json
 import logging
+import pickle
 from abc import ABC
-from typing import TypeVar
-from urllib.parse import urlparse, parse_qs
+from functools import lru_cache
+from queue import Queue, Full
+from tempfile import TemporaryFile
+from threading import Thread, Event
+from typing import TypeVar, Iterator, List, IO, Any, Iterable, Callable, Optional
+from urllib.parse import urlparse, parse_qs, urlsplit
 
 from cachetools import TTLCache
+from tldextract import TLDExtract
 
 T = TypeVar('T')  # general purpose generic variable to be used in generic functions
 V = TypeVar('V')  # generic variable for dict like situations, e.g. Dict[T, V]
 
 NON_EXISTENT = object()  # if next(it, NON_EXISTENT) is NON_EXISTENT: <do stuff if 'it' was empty>
 
+# never downloads the public suffix list; uses the snapshot bundled with the installed (locked) version of tldextract
+# instead, so domains can be determined on hosts without internet access & do not depend on when the bot was started;
+# the cache file is ignored as well, since it may contain a list downloaded earlier by some other extractor
+OFFLINE_EXTRACT = TLDExtract(cache_file=False, suffix_list_urls=(), fallback_to_snapshot=True)
+
 
 def identity(o: T) -> T:
     return o
@@ -41,7 +54,110 @@ def debug_ex(e: Exception,
         log.debug('Traceback:', exc_info=True)
 
 
+def read_json_array(f: IO[str], chunk_size: int = 2 ** 16) -> Iterator[Any]:
+    """
+    Parses JSON array from the file one value at a time, so the entire array never has to fit into memory.
+
+    :raises ValueError if the file does not contain a JSON array
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    pos = 0
+    eof = False
+
+    def more() -> bool:
+        nonlocal buffer, pos, eof
+        chunk = '' if eof else f.read(chunk_size)
+        buffer = buffer[pos:] + chunk
+        pos = 0
+        eof = not chunk
+        return not eof
+
+    def next_char() -> str:
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos].isspace():
+                pos += 1
+
+            if pos < len(buffer):
+                return buffer[pos]
+
+            if not more():
+                raise ValueError('Unexpected end of JSON array')
+
+    if next_char() != '[':
+        raise ValueError('JSON array expected')
+
+    pos += 1
+    if next_char() == ']':
+        return
+
+    while True:
+        next_char()
+        while True:
+            try:
+                value, end = decoder.raw_decode(buffer, pos)
+                after = end
+                while after < len(buffer) and buffer[after].isspace():
+                    after += 1
+
+                after = buffer[after:after + 1]
+                if eof or after in (',', ']') or after and not isinstance(value, (int, float)):
+                    break  # otherwise, the value (e.g. a number) may continue in the next chunk
+            except ValueError:
+                if eof:
+                    raise
+
+            more()
+
+        pos = end
+        yield value
+
+        separator = next_char()
+        pos += 1
+        if separator == ']':
+            return
+
+        if separator != ',':
+            raise ValueError(f'Unexpected character in JSON array: {separator}')
+
+
+def registered_domain(link: str) -> Optional[str]:
+    """
+    :returns registered domain of given link, e.g. 'dropbox.com'; None if there is no link or no domain in it
+    """
+    if not link or link.isspace():
+        return None
+
+    try:
+        url_parts = urlsplit(link.strip())
+    except ValueError:
+        return None
+
+    return host_domain(url_parts.netloc or url_parts.path.split('/')[0])
+
+
+def load_public_suffixes():
+    """
+    Loads the bundled public suffix list right away, instead of on first use (e.g. in the middle of loading CDLCs).
+    """
+    OFFLINE_EXTRACT('localhost')
+
+
+@lru_cache(maxsize=2 ** 12)
+def host_domain(host: str) -> Optional[str]:
+    """
+    Most links share a handful of hosts, so extracted domains are cached by host.
+
+    :returns registered domain of given host, e.g. 'dropbox.com' for 'www.dropbox.com'; None if there is no domain
+    """
+    return OFFLINE_EXTRACT(host).registered_domain or None
+
+
 def clean_link(link: str) -> str:
+    if not link or 'youtube.com' not in link and not link[:5].lower() == 'http:':
+        return link or ''  # nothing to clean, no need to parse
+
     try:
         url_parts = urlparse(link or '')
         if 'youtube.com' in url_parts.netloc:
@@ -87,3 +203,151 @@ class NonelessCache(TTLCache):
 
     def __missing__(self, key):
         return None
+
+
+class SpillStack(Closeable):
+    """
+    Stack which only keeps the latest chunk of values in memory. Full chunks are spilled into a temporary file.
+    Values must be picklable.
+
+    Intended for reversing very long iterators without keeping all their values in memory at once.
+
+    If a file is given, it is used instead of a temporary one, and it is neither truncated nor deleted by the stack.
+    A new stack can then continue from the chunks that were spilled into that file, see #spilled.
+    """
+    def __init__(self, chunk_size: int, file: str = None, spilled: List[int] = None):
+        self.__chunk_size = max(1, chunk_size)
+        self.__chunk: List = []
+        self.__file = file
+        self.__spill = None
+        self.__offsets: List[int] = []
+        self.__end = 0
+
+        if file:
+            self.__spill = open(file, 'r+b' if spilled else 'w+b')
+            if spilled:
+                self.__offsets = spilled[:-1]
+                self.__end = spilled[-1]
+                self.__spill.truncate(self.__end)
+
+    def close(self):
+        if self.__spill:
+            self.__spill.close()
+
+    def push(self, value) -> bool:
+        """
+        :returns true if a chunk was spilled as a result of this push, false otherwise
+        """
+        self.__chunk.append(value)
+        return len(self.__chunk) >= self.__chunk_size and self.flush()
+
+    def flush(self) -> bool:
+        """
+        Spills the latest chunk even if it is not full.
+
+        :returns true if a chunk was spilled, false if there was nothing to spill
+        """
+        if not self.__chunk:
+            return False
+
+        if not self.__spill:
+            self.__spill = TemporaryFile(prefix='spill_')
+
+        self.__spill.seek(self.__end)
+        self.__offsets.append(self.__end)
+        pickle.dump(self.__chunk, self.__spill, pickle.HIGHEST_PROTOCOL)
+        self.__spill.flush()
+        self.__end = self.__spill.tell()
+        self.__chunk = []
+        return True
+
+    def spilled(self) -> List[int]:
+        """
+        :returns offsets of all chunks spilled so far, followed by the end of the last chunk; empty if none were spilled
+        """
+        return self.__offsets + [self.__end] if self.__offsets else []
+
+    def pop_all(self) -> Iterator:
+        """
+        Generates all values in the stack, starting with the last one pushed. Values are removed as they are generated.
+        """
+        chunk, self.__chunk = self.__chunk, []
+        yield from reversed(chunk)
+
+        while self.__offsets:
+            offset = self.__offsets.pop()
+            self.__spill.seek(offset)
+            chunk = pickle.load(self.__spill)
+            if not self.__file:
+                self.__spill.seek(offset)
+                self.__spill.truncate()
+
+            self.__end = offset
+            yield from reversed(chunk)
+
+
+def merge_in_threads(iterables: List[Iterable[T]],
+                     key: Optional[Callable[[T], Any]] = None,
+                     buffer_size: int = 1000) -> Iterator[T]:
+    """
+    Reads every iterable in a separate thread and generates the items of all of them. Each thread can read up to
+    'buffer_size' items ahead.
+
+    Without a key, items are generated in whatever order the threads read them. With a key, every iterable must
+    already be sorted by it; the items are then merged so that they stay sorted.
+
+    If any iterable fails, its error is raised once reached. When the generator is closed, the threads stop reading
+    as soon as possible.
+    """
+    is_stopped = Event()
+    is_done = object()
+    if key:
+        queues = [Queue(maxsize=max(1, buffer_size)) for _ in iterables]
+    else:
+        queues = [Queue(maxsize=max(1, buffer_size))] * len(iterables)
+
+    def put(queue: Queue, item) -> bool:
+        while not is_stopped.is_set():
+            try:
+                queue.put(item, timeout=1)
+                return True
+            except Full:
+                pass
+
+        return False
+
+    def read(iterable: Iterable[T], queue: Queue):
+        items = None
+        try:
+            items = iter(iterable)
+            for item in items:
+                if not put(queue, item):
+                    break
+        except BaseException as e:
+            put(queue, e)
+        finally:
+            if hasattr(items, 'close'):
+                items.close()
+
+            put(queue, is_done)
+
+    def drain(queue: Queue, readers: int) -> Iterator[T]:
+        while readers:
+            item = queue.get()
+            if item is is_done:
+                readers -= 1
+            elif isinstance(item, BaseException):
+                raise item
+            else:
+                yield item
+
+    for i, iterable in enumerate(iterables):
+        Thread(target=read, args=(iterable, queues[i]), name=f'merge-reader-{i}', daemon=True).start()
+
+    try:
+        if key:
+            yield from heapq.merge(*[drain(queue, 1) for queue in queues], key=key)
+        else:
+            yield from drain(queues[0], len(iterables))
+    finally:
+        is_stopped.set()
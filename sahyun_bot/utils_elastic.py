@@ -1,19 +1,25 @@
 import webbrowser
-from typing import Callable, FrozenSet, List, Iterator, Type
+from typing import Callable, FrozenSet, List, Iterator, Type, Optional, Dict
 
 from elasticsearch import Elasticsearch
+from elasticsearch.helpers import bulk
+from elasticsearch_dsl import Search, A
 from elasticsearch_dsl.analysis import Analyzer
 from elasticsearch_dsl.connections import get_connection
-from tldextract import extract
+from elasticsearch_dsl.response import Hit
 
+from sahyun_bot import elastic_settings
 from sahyun_bot.elastic import CustomDLC, ManualUserRank
 from sahyun_bot.elastic_settings import BaseDoc, TEST_ONLY_VALUES
 from sahyun_bot.the_danger_zone import nuke_from_orbit
-from sahyun_bot.utils import debug_ex
+from sahyun_bot.utils import debug_ex, Closeable
 from sahyun_bot.utils_logging import get_logger
 
 LOG = get_logger(__name__)
 
+DEFAULT_KEEP_ALIVE = '1m'
+DEFAULT_PAGE_SIZE = 1000
+
 DOCUMENTS = frozenset([
     CustomDLC,
     ManualUserRank,
@@ -29,6 +35,64 @@ class ElasticAware:
         self.use_elastic = use
 
 
+class PointInTime(Closeable):
+    """
+    Point in time for the index of a document. Searches within it see the index as it was when it was opened.
+
+    Ordered searches can be paged through using search_after within the point in time. Unlike scrolling with
+    'preserve_order', this does not keep search contexts open on every shard & is as fast as unordered scrolling.
+
+    The point in time is kept alive for 'keep_alive' between pages, and closed together with this object. Elastic may
+    change its id with every response, so the latest id is always used for the next page & for closing.
+    """
+    def __init__(self, doc: Type[BaseDoc], keep_alive: str = DEFAULT_KEEP_ALIVE):
+        self.__doc = doc
+        self.__keep_alive = keep_alive
+        self.__id: Optional[str] = None
+
+    def __enter__(self):
+        es = self.__doc._get_connection()
+        self.__id = es.open_point_in_time(index=self.__doc.index_name(), keep_alive=self.__keep_alive)['id']
+
+    def close(self):
+        pit_id, self.__id = self.__id, None
+        if pit_id:
+            try:
+                self.__doc._get_connection().close_point_in_time(body={'id': pit_id})
+            except Exception as e:
+                debug_ex(e, f'close point in time for {self.__doc.__name__}', LOG, silent=True)
+
+    def scan(self,
+             s: Search,
+             *sort: str,
+             size: int = DEFAULT_PAGE_SIZE,
+             slice_id: int = 0,
+             slices: int = 1) -> Iterator[Hit]:
+        """
+        Generates all hits of the search, ordered by given fields. The last field should be unique, otherwise hits
+        which share values with the last hit of a page may be skipped.
+
+        If there are multiple slices, only the hits of the given slice are generated.
+        """
+        s = s.index().sort(*sort).extra(size=size, track_total_hits=False)
+        if slices > 1:
+            s = s.extra(slice={'id': slice_id, 'max': slices})
+
+        search_after = None
+        while True:
+            page = s.extra(pit={'id': self.__id, 'keep_alive': self.__keep_alive})
+            response = (page.extra(search_after=search_after) if search_after else page).execute()
+            self.__id = getattr(response, 'pit_id', None) or self.__id
+
+            hits = response.hits
+            yield from hits
+
+            if len(hits) < size:
+                return
+
+            search_after = list(hits[-1].meta.sort)
+
+
 def print_elastic_indexes():
     for doc in DOCUMENTS:
         LOG.warning('Using %s index: <%s>.', doc.__name__, doc.index_name())
@@ -37,7 +101,8 @@ def print_elastic_indexes():
 def setup_elastic(*modules: ElasticAware) -> bool:
     """
     Initializes all indexes if they do not yet exist. See set of documents to initialize above.
-    Also verifies if the mappings in the index match.
+    Also verifies if the mappings in the index match. If the only difference is some new fields, they are added to
+    the existing index & filled in for existing documents if possible.
     """
     is_setup = _with_elastic('setup', _setup)
     setup_elastic_usage(*modules, use_elastic=is_setup)
@@ -103,30 +168,89 @@ def browse(query: str):
         webbrowser.open(hit.link, new=2, autoraise=False)
 
 
+def domain_counts() -> Dict[str, int]:
+    """
+    :returns amount of CDLCs for every domain of links in the current index; aggregated, links are not parsed
+    """
+    counts = {}
+    after = {}
+    while True:
+        s = CustomDLC.search()[0:0]
+        s.aggs.bucket('domains', 'composite', size=DEFAULT_PAGE_SIZE,
+                      sources=[{'domain': A('terms', field='download_domain')}], **after)
+        result = s.execute().aggs.domains
+        for bucket in result.buckets:
+            counts[bucket.key.domain] = bucket.doc_count
+
+        if len(result.buckets) < DEFAULT_PAGE_SIZE:
+            return counts
+
+        after = {'after': result.after_key.to_dict()}
+
+
 def domains() -> FrozenSet[str]:
     """
     :returns set of domains for all links in the current index.
     """
-    return frozenset(extract(hit.link).registered_domain for hit in CustomDLC.search().scan())
+    return frozenset(domain_counts())
 
 
 def domain_example(domain: str, skip: int = 0) -> str:
-    all_links = domain_all(domain)
+    """
+    :returns link of the CDLC with given domain, after skipping 'skip' such CDLCs (by id); skipped CDLCs are paged
+    through using search_after on their ids, without fetching them, and only the returned CDLC is fetched
+    """
+    s = CustomDLC.search().filter('term', download_domain=domain).sort('id')
 
-    link = ''
-    for i in range(skip + 1):
-        link = next(all_links, '')
-        if not link:
+    search_after = {}
+    while skip > 0:
+        size = min(skip, DEFAULT_PAGE_SIZE)
+        hits = s.source(False).extra(size=size, **search_after).execute().hits
+        if len(hits) < size:
             return LOG.warning('No more examples for domain <%s> found.', domain)
 
-    return link
+        skip -= size
+        search_after = {'search_after': list(hits[-1].meta.sort)}
+
+    for hit in s.extra(size=1, **search_after).execute():
+        LOG.warning('Found CDLC#%05d <%s>', hit.id, hit)
+        return hit.link
+
+    return LOG.warning('No more examples for domain <%s> found.', domain)
 
 
 def domain_all(domain: str) -> Iterator[str]:
-    for hit in CustomDLC.search().scan():
-        if extract(hit.link).registered_domain == domain:
-            LOG.warning('Found CDLC#%05d <%s>', hit.id, hit)
-            yield hit.link
+    for hit in CustomDLC.search().filter('term', download_domain=domain).scan():
+        LOG.warning('Found CDLC#%05d <%s>', hit.id, hit)
+        yield hit.link
+
+
+def index_domains() -> int:
+    """
+    Fills in 'download_domain' for CDLCs which were indexed before the field existed. This is done during setup,
+    right after the field is added to an existing index, but can be repeated safely, as CDLCs which already have
+    the field are skipped. Documents are re-indexed with the same external version, so continuity is not affected.
+
+    :returns amount of CDLCs updated
+    """
+    s = CustomDLC.search().filter('exists', field='direct_download').exclude('exists', field='download_domain')
+
+    def actions():
+        for hit in s.params(version=True).scan():
+            cdlc = CustomDLC(_id=hit.meta.id, **hit.to_dict())
+            cdlc.clean()
+            action = cdlc.to_dict(include_meta=True)
+            action['_version'] = hit.meta.version
+            action['_version_type'] = 'external_gte'
+            yield action
+
+    updated, errors = bulk(CustomDLC._get_connection(),
+                           actions(),
+                           chunk_size=DEFAULT_PAGE_SIZE,
+                           raise_on_error=False,
+                           refresh=elastic_settings.e_refresh)
+    LOG.warning('Filled in download domain for %d CDLCs, %d failed.', updated, len(errors))
+    return updated
 
 
 def tokenize(analyzer: Analyzer, text: str):
@@ -151,13 +275,35 @@ def _setup(es: Elasticsearch):
         index = doc.index_name()
         if es.indices.exists(index):
             mapping_on_server = es.indices.get_mapping(index)[index]['mappings']
-            if mapping_on_server != doc.mapping():
+            if mapping_on_server == doc.mapping():
+                continue
+
+            if not _only_adds_fields(mapping_on_server, doc.mapping()):
                 LOG.critical('Mapping mismatch for %s! Using this index may produce unpredictable results!', index)
+                continue
+
+            LOG.warning('Adding new fields to index: %s.', index)
+            doc.init()
+            if doc is CustomDLC:
+                index_domains()
         else:
             LOG.warning('Initializing index: %s.', index)
             doc.init()
 
 
+def _only_adds_fields(mapping_on_server: dict, mapping: dict) -> bool:
+    """
+    :returns true if the mapping only has some fields which are not on the server yet; such fields can be put into
+    the existing index without the need to #migrate
+    """
+    properties_on_server = mapping_on_server.get('properties', {})
+    properties = mapping.get('properties', {})
+    if any(properties.get(name, None) != field for name, field in properties_on_server.items()):
+        return False
+
+    return {**mapping_on_server, 'properties': properties} == mapping
+
+
 def _purge(es: Elasticsearch):
     for doc in DOCUMENTS:
         LOG.critical('Deleting index & its contents (if it exists): %s', doc.index_name())
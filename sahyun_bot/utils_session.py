@@ -1,11 +1,56 @@
-from requests import Session
-from requests.adapters import HTTPAdapter
-from urllib3 import Retry
+import base64
+import gzip
+import hashlib
+import json
+import os
+import time
+from collections import defaultdict, deque
+from http.client import HTTPMessage
+from io import BytesIO
+from threading import Lock
+from typing import Callable, Deque, Dict, Tuple, Optional, Any
+from urllib.parse import urlparse, urlsplit, parse_qsl, urlencode
 
+from requests import Session, PreparedRequest, Response
+from requests.adapters import HTTPAdapter, DEFAULT_POOLSIZE
+from requests.exceptions import ConnectionError
+from urllib3 import Retry, HTTPResponse
+
+from sahyun_bot.utils import Closeable
 from sahyun_bot.utils_logging import HttpDump
 
 DEFAULT_RETRY_COUNT = 3
 
+DEFAULT_POOL_SIZE = 4
+DEFAULT_IDLE_SECONDS = 60
+
+CASSETTE_RECORD = 'record'
+CASSETTE_REPLAY = 'replay'
+CASSETTE_MODES = frozenset([
+    CASSETTE_RECORD,
+    CASSETTE_REPLAY,
+])
+DEFAULT_CASSETTE_DIR = '.cassettes'
+
+CASSETTE_IGNORED_PARAMS = frozenset([
+    '_',  # cache buster, changes for every request
+])
+
+CASSETTE_DROPPED_HEADERS = frozenset([
+    'content-encoding',  # content is stored decoded
+    'content-length',
+    'transfer-encoding',
+])
+
+CASSETTE_REDACTED = 'redacted'
+CASSETTE_REDACTED_FIELDS = frozenset([
+    'access_token',
+    'refresh_token',
+    'id_token',
+    'client_secret',
+    'password',
+])
+
 RETRY_ON_METHOD = frozenset([
     'HEAD', 'GET', 'POST', 'PUT', 'DELETE', 'OPTIONS', 'TRACE'
 ])
@@ -15,21 +60,289 @@ RETRY_ON_STATUS = frozenset([
 ])
 
 
+class SessionPool(Closeable):
+    """
+    Keeps idle sessions so their connections can be reused by subsequent calls to the same host. Thread-safe.
+
+    Up to 'size' idle sessions are kept for every key. Sessions that stay idle longer than 'idle_seconds' are closed
+    the next time the pool is used.
+    """
+    def __init__(self,
+                 size: int = DEFAULT_POOL_SIZE,
+                 idle_seconds: int = DEFAULT_IDLE_SECONDS,
+                 get_time: Callable[[], float] = time.monotonic):
+        self.__size = max(0, size) or DEFAULT_POOL_SIZE
+        self.__idle_seconds = max(0, idle_seconds) or DEFAULT_IDLE_SECONDS
+        self.__get_time = get_time
+
+        self.__lock = Lock()
+        self.__idle: Dict[str, Deque[Tuple[float, Session]]] = defaultdict(deque)
+
+    def close(self):
+        with self.__lock:
+            for sessions in self.__idle.values():
+                while sessions:
+                    sessions.pop()[1].discard()
+
+            self.__idle.clear()
+
+    def acquire(self, key: str, create: Callable[[], Session]) -> Session:
+        """
+        :returns most recently used idle session for given key; if there are none, a new session from 'create'
+        """
+        with self.__lock:
+            self.__evict()
+            sessions = self.__idle[key]
+            if sessions:
+                return sessions.pop()[1]
+
+        return create()
+
+    def release(self, key: str, session: Session):
+        """
+        Returns the session to the pool. If the pool is full, closes the session instead.
+        """
+        session.cookies.clear()
+
+        with self.__lock:
+            self.__evict()
+            sessions = self.__idle[key]
+            if len(sessions) < self.__size:
+                return sessions.append((self.__get_time(), session))
+
+        session.discard()
+
+    def __evict(self):
+        expired = self.__get_time() - self.__idle_seconds
+        for sessions in self.__idle.values():
+            while sessions and sessions[0][0] <= expired:
+                sessions.popleft()[1].discard()
+
+
+DEFAULT_POOL = SessionPool()
+
+
+class PooledSession(Session):
+    """
+    Session which returns itself to the pool instead of closing. Cookies are not kept between uses.
+    """
+    def __init__(self, pool: SessionPool, key: str):
+        super().__init__()
+        self.__pool = pool
+        self.__key = key
+
+    def close(self):
+        self.__pool.release(self.__key, self)
+
+    def discard(self):
+        """
+        Closes the session for real, along with all of its connections.
+        """
+        super().close()
+
+
+class Cassette:
+    """
+    Stores HTTP responses in a directory, one gzipped JSON file per request. Thread-safe.
+
+    In record mode, requests are performed as usual and their responses are stored, replacing any previous ones.
+    In replay mode, no requests are performed. Stored responses are returned after waiting 'latency' seconds instead.
+    Requests which have no stored response fail as if the connection failed.
+
+    Requests are matched by method, URL and body. Headers and cache busting query parameters are ignored.
+    Only hashes of the requests are stored, so secrets in URLs or bodies do not end up in the directory.
+    Responses are stored with values of cookies & token fields in JSON redacted, so replayed sessions get cookies
+    and tokens which work for the cassette, but not for the actual websites.
+    """
+    def __init__(self, mode: str, directory: str = DEFAULT_CASSETTE_DIR, latency: float = 0):
+        if mode not in CASSETTE_MODES:
+            raise ValueError(f'Unknown cassette mode: {mode}')
+
+        self.__mode = mode
+        self.__directory = directory or DEFAULT_CASSETTE_DIR
+        self.__latency = max(0.0, latency)
+
+    def __str__(self):
+        return f'{self.__mode}:{self.__directory}'
+
+    def is_replay(self) -> bool:
+        return self.__mode == CASSETTE_REPLAY
+
+    def latency(self) -> float:
+        return self.__latency
+
+    def load(self, request: PreparedRequest) -> Optional[dict]:
+        """
+        :returns stored response for given request, if any
+        """
+        try:
+            with gzip.open(self.__path(request), 'rt', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def save(self, request: PreparedRequest, response: Response):
+        headers = [(key, self.__redact_cookie(value) if key.lower() == 'set-cookie' else value)
+                   for key, value in self.__raw_headers(response)
+                   if key.lower() not in CASSETTE_DROPPED_HEADERS]
+
+        recorded = {
+            'method': request.method,
+            'status': response.status_code,
+            'reason': response.reason,
+            'headers': headers,
+            'content': base64.b64encode(self.__redact_content(response)).decode('ascii'),
+        }
+
+        os.makedirs(self.__directory, exist_ok=True)
+        path = self.__path(request)
+        temp_path = f'{path}.{os.getpid()}.{id(response)}.tmp'
+        with gzip.open(temp_path, 'wt', encoding='utf-8') as f:
+            json.dump(recorded, f)
+
+        os.replace(temp_path, path)
+
+    def __path(self, request: PreparedRequest) -> str:
+        return os.path.join(self.__directory, f'{self.__key(request)}.json.gz')
+
+    @staticmethod
+    def __key(request: PreparedRequest) -> str:
+        url = urlsplit(request.url)
+        params = sorted((k, v) for k, v in parse_qsl(url.query, keep_blank_values=True)
+                        if k not in CASSETTE_IGNORED_PARAMS)
+
+        body = request.body or b''
+        body = body.encode('utf-8') if isinstance(body, str) else body
+
+        h = hashlib.sha1(f'{request.method} {url.scheme}://{url.netloc}{url.path}?{urlencode(params)}'.encode('utf-8'))
+        h.update(body)
+        return h.hexdigest()
+
+    @staticmethod
+    def __redact_cookie(value: str) -> str:
+        name, separator, rest = value.partition('=')
+        attributes = rest.partition(';')[2]
+        return f'{name}={CASSETTE_REDACTED};{attributes}' if attributes else f'{name}={CASSETTE_REDACTED}'
+
+    @staticmethod
+    def __redact_content(response: Response) -> bytes:
+        if 'json' not in response.headers.get('Content-Type', '').lower():
+            return response.content
+
+        try:
+            data = response.json()
+        except ValueError:
+            return response.content
+
+        return json.dumps(redact(data)).encode('utf-8')
+
+    @staticmethod
+    def __raw_headers(response: Response):
+        headers = response.raw.headers if response.raw is not None else response.headers
+        iteritems = getattr(headers, 'iteritems', headers.items)  # keeps repeated headers, e.g. Set-Cookie
+        return iteritems()
+
+
+def redact(data: Any) -> Any:
+    """
+    :returns copy of JSON data with values of all CASSETTE_REDACTED_FIELDS replaced, no matter how deep they are
+    """
+    if isinstance(data, dict):
+        return {k: CASSETTE_REDACTED if k in CASSETTE_REDACTED_FIELDS else redact(v) for k, v in data.items()}
+
+    if isinstance(data, list):
+        return [redact(v) for v in data]
+
+    return data
+
+
+class RecordedOrigin:
+    """
+    Stands in for http.client.HTTPResponse behind replayed responses. Requests extracts cookies from its headers.
+    """
+    def __init__(self, msg: HTTPMessage):
+        self.msg = msg
+
+    def isclosed(self) -> bool:
+        return True
+
+    def close(self):
+        pass
+
+
+class CassetteAdapter(HTTPAdapter):
+    """
+    HTTPAdapter which records responses into a Cassette, or replays them from it.
+    """
+    def __init__(self, cassette: Cassette, **kwargs):
+        super().__init__(**kwargs)
+        self.__cassette = cassette
+
+    def send(self, request: PreparedRequest, **kwargs) -> Response:
+        if not self.__cassette.is_replay():
+            response = super().send(request, **kwargs)
+            self.__cassette.save(request, response)
+            return response
+
+        recorded = self.__cassette.load(request)
+        if recorded is None:
+            raise ConnectionError(f'No recorded response for {request.method} {request.url}', request=request)
+
+        time.sleep(self.__cassette.latency())
+        return self.build_response(request, self.__to_raw(recorded))
+
+    @staticmethod
+    def __to_raw(recorded: dict) -> HTTPResponse:
+        message = HTTPMessage()
+        for key, value in recorded['headers']:
+            message[key] = value
+
+        return HTTPResponse(body=BytesIO(base64.b64decode(recorded['content'])),
+                            headers=recorded['headers'],
+                            status=recorded['status'],
+                            reason=recorded['reason'],
+                            preload_content=False,
+                            decode_content=False,
+                            original_response=RecordedOrigin(message))
+
+
 class SessionFactory:
     """
     Creates Session objects for use with the application. These objects will log HTTP information and retry requests.
     Retry count is configurable.
 
+    Sessions are taken from the pool (shared by default) and returned to it once they are closed. This way connections
+    to the same host are kept alive between calls. Sessions are not shared while in use.
+
+    If a cassette is given, sessions record responses into it, or replay them from it. See Cassette.
+
     All other kwargs will be passed into HttpDump.
     """
-    def __init__(self, retry_count: int = DEFAULT_RETRY_COUNT, **dump_kwargs):
+    def __init__(self,
+                 retry_count: int = DEFAULT_RETRY_COUNT,
+                 pool: SessionPool = None,
+                 max_connections: int = DEFAULT_POOLSIZE,
+                 cassette: Cassette = None,
+                 **dump_kwargs):
         self.__dump = HttpDump(**dump_kwargs)
         self.__retry_count = max(0, retry_count) or DEFAULT_RETRY_COUNT
+        self.__pool = pool or DEFAULT_POOL
+        self.__max_connections = max(0, max_connections) or DEFAULT_POOLSIZE
+        self.__cassette = cassette
+
+    def with_retry(self, session: Session = None, for_url: str = None) -> Session:
+        """
+        :param session: session to configure; if not given, a pooled session is used instead
+        :param for_url: URL (or any URL of the same host) that the session is intended for; improves connection reuse
+        """
+        if not session:
+            key = f'{urlparse(for_url or "").netloc}#{self.__retry_count}#{self.__max_connections}#{self.__cassette}'
+            session = self.__pool.acquire(key, lambda: self.__mount(PooledSession(self.__pool, key)))
 
-    def with_retry(self, session: Session = None) -> Session:
-        session = session or Session()
         session.hooks['response'] = [self.__dump.all]
+        return session if isinstance(session, PooledSession) else self.__mount(session)
 
+    def __mount(self, session: Session) -> Session:
         retry = Retry(
             total=self.__retry_count,
             connect=self.__retry_count,
@@ -38,7 +351,11 @@ class SessionFactory:
             status_forcelist=RETRY_ON_STATUS,
             backoff_factor=1
         )
-        adapter = HTTPAdapter(max_retries=retry)
+        if self.__cassette:
+            adapter = CassetteAdapter(self.__cassette, max_retries=retry, pool_maxsize=self.__max_connections)
+        else:
+            adapter = HTTPAdapter(max_retries=retry, pool_maxsize=self.__max_connections)
+
         session.mount('http://', adapter)
         session.mount('https://', adapter)
         return session
@@ -27,7 +27,7 @@ MANUAL_USERS = {
 @pytest.fixture(scope='session', autouse=True)
 def prepare_cdlc_data():
     data_dir = Path(os.path.realpath(__file__)).parent / 'data'
-    for p in data_dir.glob('cdlc_*.json'):
+    for p in sorted(data_dir.glob('cdlc_*.json')):
         with p.open() as f:
             MOCK_CDLC.append(json.load(f))
 
@@ -96,7 +96,9 @@ def prepare_cdlcs(doc):
     for cdlc in MOCK_CDLC:
         c = To.cdlc(cdlc)
         c['from_auto_index'] = False
-        yield doc(_id=cdlc['id'], **c)
+        d = doc(_id=cdlc['id'], **c)
+        d.clean()
+        yield d
 
 
 def prepare_users(doc):
@@ -137,6 +139,7 @@ def commander(users, twitchy):
 @pytest.fixture
 def cf():
     return CustomsforgeClient(batch_size=1,
+                              page_backoff=0,
                               email=MOCK_EMAIL,
                               password=MOCK_PASS,
                               cookie_jar_file=None,
@@ -1,3 +1,5 @@
+from urllib.parse import parse_qs
+
 from sahyun_bot.customsforge import LOGIN_PAGE, LOGIN_REDIRECT
 from tests.mock_settings import *
 
@@ -32,11 +34,14 @@ def login_mock(url, request):
 
 def cdlcs_mock(url, request):
     if 'draw' in url.query:
+        query = parse_qs(url.query)
+        start = int(query['start'][0])
+        length = int(query['length'][0])
         return ok({
             'draw': 1,
-            'recordsTotal': 6,
-            'recordsFiltered': 6,
-            'data': MOCK_CDLC if 'start=0' in url.query else []
+            'recordsTotal': len(MOCK_CDLC),
+            'recordsFiltered': len(MOCK_CDLC),
+            'data': MOCK_CDLC[start:start + length],
         })
 
     return ok('Default ignition page. Used for pinging.')
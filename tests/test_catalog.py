@@ -0,0 +1,66 @@
+import pytest
+from assertpy import assert_that
+
+from sahyun_bot.catalog import SnapshotWriter, CatalogSnapshot
+
+CDLCS = [
+    {'id': 3, 'snapshot_timestamp': 1641772800, 'parts': ['lead', 'vocals'], 'platforms': ['pc'],
+     'is_official': False},
+    {'id': 1, 'snapshot_timestamp': 1641859200, 'parts': ['bass'], 'platforms': ['pc', 'mac'],
+     'is_official': True},
+    {'id': 2, 'snapshot_timestamp': 1641686400, 'parts': ['lead', 'rhythm'], 'platforms': ['mac'],
+     'is_official': False},
+]
+
+
+@pytest.fixture
+def snapshot(tmp_path):
+    file = tmp_path / 'catalog.snap'
+    writer = SnapshotWriter(file)
+    with writer:
+        for cdlc in CDLCS:
+            writer.write(cdlc)
+
+    s = CatalogSnapshot(file)
+    yield s
+    s.close()
+
+
+def test_get(snapshot):
+    assert_that(snapshot).is_length(3)
+    assert_that(snapshot.get(2)).is_equal_to(CDLCS[2])
+    assert_that(snapshot.get(4)).is_none()
+    assert_that(snapshot.timestamp(1)).is_equal_to(1641859200)
+
+
+def test_find(snapshot):
+    assert_that(list(snapshot.find())).is_equal_to([1, 2, 3])
+    assert_that(list(snapshot.find(is_official=True))).is_equal_to([1])
+    assert_that(list(snapshot.find(is_official=False, parts=['lead']))).is_equal_to([2, 3])
+    assert_that(list(snapshot.find(platforms=['mac'], parts=['lead']))).is_equal_to([2])
+
+    assert_that(snapshot.find).raises(ValueError).when_called_with(parts=['drums'])
+
+
+def test_read_all(snapshot):
+    assert_that(list(snapshot.read_all())).extracting('id').is_equal_to([2, 3, 1])
+    assert_that(list(snapshot.read_all(1641772800))).extracting('id').is_equal_to([3, 1])
+
+
+def test_keeps_newer(tmp_path):
+    file = tmp_path / 'catalog.snap'
+    writer = SnapshotWriter(file)
+    with writer:
+        writer.write({'id': 1, 'snapshot_timestamp': 1641772800, 'title': 'newer'})
+        writer.write({'id': 1, 'snapshot_timestamp': 1641686400, 'title': 'older'})
+
+    snapshot = CatalogSnapshot(file)
+    with snapshot:
+        assert_that(snapshot.get(1)).is_equal_to({'id': 1, 'snapshot_timestamp': 1641772800, 'title': 'newer'})
+
+
+def test_not_a_snapshot(tmp_path):
+    file = tmp_path / 'catalog.snap'
+    file.write_bytes(b'not a snapshot at all')
+
+    assert_that(CatalogSnapshot).raises(ValueError).when_called_with(file)
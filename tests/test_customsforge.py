@@ -1,13 +1,17 @@
+import html
 import os
 import pickle
-from datetime import timedelta
+from datetime import timedelta, datetime, timezone
+from urllib.parse import parse_qs, urlparse
 
 import pytest
 from assertpy import assert_that
 from httmock import HTTMock
 from requests.cookies import RequestsCookieJar
 
-from sahyun_bot.customsforge import To, CustomsforgeClient
+from sahyun_bot.customsforge import To, CustomsforgeClient, Fingerprints, AdaptiveBatch, AFTER_GAP, CDLC_PAGE, \
+    DOWNLOAD_API, CONVERT_ALL, CONVERT_KNOWN
+from sahyun_bot.utils_settings import parse_bool
 from sahyun_bot.customsforge_settings import TEST_COOKIE_FILE
 from tests.mock_customsforge import customsforge
 from tests.mock_settings import *
@@ -16,6 +20,7 @@ from tests.mock_settings import *
 @pytest.fixture
 def cf_off():
     return CustomsforgeClient(batch_size=1,
+                              page_backoff=0,
                               cookie_jar_file=None,
                               get_today=lambda: TEST_DATE)
 
@@ -82,6 +87,254 @@ def test_cdlcs(cf):
         assert_that(full_two_days).contains(65176, 65175).is_length(2)
 
 
+def test_cdlcs_parallel_pages():
+    expected = [cdlc['id'] for cdlc in reversed(MOCK_CDLC)]
+
+    with HTTMock(customsforge):
+        for parallel_pages in [1, 2, 4, 10]:
+            c = CustomsforgeClient(batch_size=1,
+                                   parallel_pages=parallel_pages,
+                                   email=MOCK_EMAIL,
+                                   password=MOCK_PASS,
+                                   cookie_jar_file=None,
+                                   get_today=lambda: TEST_DATE)
+
+            assert_that([cdlc['id'] for cdlc in c.cdlcs()]).is_equal_to(expected)
+
+
+def test_cdlcs_adaptive():
+    with HTTMock(customsforge):
+        c = CustomsforgeClient(adaptive=True,
+                               min_batch_size=1,
+                               batch_size=2,
+                               email=MOCK_EMAIL,
+                               password=MOCK_PASS,
+                               cookie_jar_file=None,
+                               get_today=lambda: TEST_DATE)
+
+        assert_that([cdlc['id'] for cdlc in c.cdlcs()]).is_equal_to([cdlc['id'] for cdlc in reversed(MOCK_CDLC)])
+
+
+def test_adaptive_batch():
+    batch = AdaptiveBatch(minimum=10, maximum=100, target_latency=1, max_payload=1000)
+    assert_that(batch.next()).is_equal_to(10)
+
+    batch.observe(10, latency=0.1, payload=10, success=True)
+    assert_that(batch.next()).is_equal_to(20)  # cannot grow more than twice at once
+
+    batch.observe(20, latency=0.5, payload=20, success=True)
+    assert_that(batch.next()).is_equal_to(40)
+
+    batch.observe(40, latency=0.8, payload=40, success=True)
+    assert_that(batch.next()).is_equal_to(50)
+
+    batch.observe(50, latency=0.1, payload=1000, success=True)
+    assert_that(batch.next()).is_equal_to(50)  # payload is too large to grow
+
+    batch.observe(50, latency=0.1, payload=50, success=True)
+    assert_that(batch.next()).is_equal_to(100)
+
+    batch.observe(100, latency=0.1, payload=100, success=True)
+    assert_that(batch.next()).is_equal_to(100)  # cannot grow above maximum
+
+    batch.observe(100, latency=4, payload=100, success=True)
+    assert_that(batch.next()).is_equal_to(50)  # cannot shrink more than twice at once
+
+    batch.observe(50, latency=1, payload=50, success=False)
+    assert_that(batch.next()).is_equal_to(25)
+
+    batch.observe(25, latency=1, payload=25, success=False)
+    assert_that(batch.next()).is_equal_to(12)
+
+    batch.observe(12, latency=1, payload=12, success=False)
+    assert_that(batch.next()).is_equal_to(10)  # cannot shrink below minimum
+
+    batch.observe(10, latency=0.1, payload=10, success=True)
+    assert_that(batch.next()).is_equal_to(10)  # too many errors recently to grow
+
+
+def test_cdlcs_fingerprints(cf, monkeypatch, tmp_path):
+    file = str(tmp_path / 'fingerprints')
+    fingerprints = Fingerprints(file)
+
+    with HTTMock(customsforge):
+        assert_that(list(cf.cdlcs(fingerprints=fingerprints))).is_length(6)
+        assert_that(list(cf.cdlcs(fingerprints=fingerprints))).is_length(6)  # nothing was committed yet
+
+        fingerprints.commit()
+        assert_that(list(cf.cdlcs(fingerprints=fingerprints))).is_empty()
+        assert_that(list(cf.cdlcs(fingerprints=Fingerprints(file)))).is_empty()
+
+        monkeypatch.setitem(MOCK_CDLC[1], 'downloads', 1000)  # ignored, since it is not part of the cdlc
+        assert_that(list(cf.cdlcs(fingerprints=fingerprints))).is_empty()
+
+        monkeypatch.setitem(MOCK_CDLC[1], 'title', 'Changed')
+        assert_that([cdlc['title'] for cdlc in cf.cdlcs(fingerprints=fingerprints)]).is_equal_to(['Changed'])
+
+        fingerprints.forget()
+        assert_that(list(cf.cdlcs(fingerprints=fingerprints))).is_length(6)
+
+
+class Crash(BaseException):
+    pass
+
+
+def test_cdlcs_checkpoint(tmp_path):
+    checkpoint = str(tmp_path / f'checkpoint_{CONVERT_ALL}')
+    expected = [cdlc['id'] for cdlc in reversed(MOCK_CDLC)]
+    starts = []
+
+    @all_requests
+    def crashing(url, request):
+        if 'start=4' in url.query and 'crashed' not in starts:
+            raise Crash()
+
+        if 'start=' in url.query:
+            starts.append(parse_qs(url.query)['start'][0])
+
+        return customsforge(url, request)
+
+    c = CustomsforgeClient(batch_size=2,
+                           parallel_pages=1,
+                           checkpoint_file=str(tmp_path / 'checkpoint'),
+                           email=MOCK_EMAIL,
+                           password=MOCK_PASS,
+                           cookie_jar_file=None,
+                           get_today=lambda: TEST_DATE)
+
+    with HTTMock(crashing):
+        with pytest.raises(Crash):
+            list(c.cdlcs())
+
+        assert_that(os.path.exists(checkpoint)).is_true()
+
+        starts.append('crashed')
+        assert_that([cdlc['id'] for cdlc in c.cdlcs()]).is_equal_to(expected)
+        assert_that(starts[starts.index('crashed'):]).is_equal_to(['crashed', '4', '6'])  # resumed from the checkpoint
+        assert_that(os.path.exists(checkpoint)).is_false()
+
+    with HTTMock(customsforge):
+        partial = c.cdlcs()
+        assert_that(next(partial)['id']).is_equal_to(expected[0])
+        partial.close()
+
+    with HTTMock(server_down):
+        assert_that([cdlc['id'] for cdlc in c.cdlcs()]).is_equal_to(expected)  # crawl was already complete
+
+    assert_that(os.listdir(tmp_path)).is_empty()
+
+
+def test_cdlcs_checkpoint_other_crawl(tmp_path, monkeypatch):
+    checkpoint = str(tmp_path / f'checkpoint_{CONVERT_KNOWN}')
+    fingerprints = Fingerprints()
+
+    @all_requests
+    def crashing(url, request):
+        if 'start=4' in url.query:
+            raise Crash()
+
+        return customsforge(url, request)
+
+    c = CustomsforgeClient(batch_size=2,
+                           parallel_pages=1,
+                           checkpoint_file=str(tmp_path / 'checkpoint'),
+                           email=MOCK_EMAIL,
+                           password=MOCK_PASS,
+                           cookie_jar_file=None,
+                           get_today=lambda: TEST_DATE)
+
+    with HTTMock(customsforge):
+        assert_that(list(c.cdlcs(fingerprints=fingerprints))).is_length(6)
+        fingerprints.commit()
+
+    monkeypatch.setitem(MOCK_CDLC[2], 'title', 'Changed')
+    monkeypatch.setitem(MOCK_CDLC[3], 'title', 'Changed')
+    with HTTMock(crashing):
+        with pytest.raises(Crash):
+            list(c.cdlcs(fingerprints=fingerprints))
+
+    assert_that(os.path.exists(checkpoint)).is_true()
+
+    # the incremental crawl only spilled changed CDLCs, so a full crawl must start over, but in its own files
+    with HTTMock(customsforge):
+        assert_that([cdlc['id'] for cdlc in c.cdlcs()]).is_equal_to([cdlc['id'] for cdlc in reversed(MOCK_CDLC)])
+        assert_that(os.path.exists(checkpoint)).is_true()
+
+        changed = [cdlc['id'] for cdlc in c.cdlcs(fingerprints=fingerprints)]
+        assert_that(changed).is_equal_to([MOCK_CDLC[3]['id'], MOCK_CDLC[2]['id']])
+
+    assert_that(os.listdir(tmp_path)).is_empty()
+
+
+def test_cdlcs_checkpoint_concurrent_crawl(tmp_path):
+    expected = [cdlc['id'] for cdlc in reversed(MOCK_CDLC)]
+    checkpoint = str(tmp_path / f'checkpoint_{CONVERT_ALL}')
+
+    c = CustomsforgeClient(batch_size=2,
+                           parallel_pages=1,
+                           checkpoint_file=str(tmp_path / 'checkpoint'),
+                           email=MOCK_EMAIL,
+                           password=MOCK_PASS,
+                           cookie_jar_file=None,
+                           get_today=lambda: TEST_DATE)
+
+    with HTTMock(customsforge):
+        first = c.cdlcs()
+        assert_that(next(first)['id']).is_equal_to(expected[0])
+        with open(checkpoint, 'r') as f:
+            owned = f.read()
+
+        # the first crawl owns the checkpoint, so the second one does not touch it
+        assert_that([cdlc['id'] for cdlc in c.cdlcs()]).is_equal_to(expected)
+        with open(checkpoint, 'r') as f:
+            assert_that(f.read()).is_equal_to(owned)
+
+        assert_that([cdlc['id'] for cdlc in first]).is_equal_to(expected[1:])
+
+    assert_that(os.listdir(tmp_path)).is_empty()
+
+
+def test_cdlcs_gaps(cf):
+    expected = [cdlc['id'] for cdlc in reversed(MOCK_CDLC)]
+    failures = {'2': 3, '4': 100}
+
+    @all_requests
+    def flaky(url, request):
+        start = parse_qs(url.query).get('start', [None])[0]
+        if failures.get(start, 0) > 0:
+            failures[start] -= 1
+            return {'status_code': 404, 'reason': 'Not Found', 'content': 'Flaky page'}
+
+        return customsforge(url, request)
+
+    with HTTMock(flaky):
+        cdlcs = list(cf.cdlcs())
+
+    assert_that([cdlc['id'] for cdlc in cdlcs]).is_equal_to(expected[:1] + expected[2:])  # page 2 failed for good
+    assert_that([cdlc.get(AFTER_GAP, False) for cdlc in cdlcs]).is_equal_to([False, True, True, True, True])
+    assert_that(failures).is_equal_to({'2': 0, '4': 94})  # page 1 was refilled after three failures
+
+
+def test_cdlcs_too_many_failures(cf):
+    failed = []
+
+    @all_requests
+    def failing(url, request):
+        start = parse_qs(url.query).get('start', [None])[0]
+        if start and int(start) >= 3:
+            failed.append(start)
+            raise Exception('Failure as expected')
+
+        return customsforge(url, request)
+
+    with HTTMock(failing):
+        cdlcs = list(cf.cdlcs())
+
+    assert_that([cdlc['id'] for cdlc in cdlcs]).is_equal_to([MOCK_CDLC[i]['id'] for i in [2, 1, 0]])
+    assert_that(cdlcs).extracting(AFTER_GAP).contains_only(True)
+    assert_that(failed).contains('3', '4', '5').does_not_contain('9')  # only pages requested in parallel
+
+
 def test_to_cdlc():
     assert_that(To.cdlc(MOCK_CDLC[0])).contains_entry(
         id=65176,
@@ -105,3 +358,108 @@ def test_to_cdlc():
 
         snapshot_timestamp=1641772800,
     )
+
+
+def test_to_cdlc_alternative_tunings(monkeypatch):
+    monkeypatch.setitem(MOCK_CDLC[0], 'alt_lead', ' Drop D ')
+    monkeypatch.setitem(MOCK_CDLC[0], 'alt_bass', '0')
+    monkeypatch.setitem(MOCK_CDLC[0], 'file_mac_link', '   ')
+    monkeypatch.setitem(MOCK_CDLC[0], 'has_lyrics', 'false')
+
+    assert_that(To.cdlc(MOCK_CDLC[0])).contains_entry(
+        tuning=['E Standard', 'E Standard', 'Drop D'],
+        parts=['lead', 'bass', 'lead'],
+        platforms=['pc'],
+    )
+
+
+def legacy_cdlc(c: dict) -> dict:
+    """
+    To.cdlc as it was before conversion was optimized, which it must still match exactly.
+    """
+    def read(data, key):
+        value = '' if data[key] is None else str(data[key])
+        return html.unescape(value.strip())
+
+    def read_link(data, key):
+        link = read(data, key)
+        try:
+            url_parts = urlparse(link or '')
+            if 'youtube.com' in url_parts.netloc:
+                video_id = parse_qs(url_parts.query).get('v', None)
+                if video_id:
+                    return f'https://youtu.be/{video_id[0]}'
+            elif url_parts.scheme == 'http':
+                return link[:4] + 's' + link[4:]
+        except ValueError:
+            pass
+
+        return link or ''
+
+    def read_bool(key):
+        return parse_bool(read(c, key))
+
+    tunings, parts = [], []
+    for tuning in ['lead', 'rhythm', 'bass', 'alt_lead', 'alt_rhythm', 'alt_bass']:
+        value = read(c, tuning)
+        if value and not value.isspace() and not value == '0':
+            tunings.append(value)
+            parts.append(tuning.rpartition('alt_')[2])
+
+    if read_bool('has_lyrics'):
+        parts.append('vocals')
+
+    instruments = [info for key, info in [
+        ('require_capo_lead', 'ii_capolead'),
+        ('require_capo_rhythm', 'ii_caporhythm'),
+        ('require_slide_lead', 'ii_slidelead'),
+        ('require_slide_rhythm', 'ii_sliderhythm'),
+        ('require_five_bass', 'ii_5stringbass'),
+        ('require_six_bass', 'ii_6stringbass'),
+        ('require_seven_guitar', 'ii_7stringguitar'),
+        ('require_twelve_guitar', 'ii_12stringguitar'),
+        ('require_heavy_gauge', 'ii_heavystrings'),
+        ('require_whammy_bar', 'ii_tremolo'),
+    ] if read_bool(key)]
+
+    links = {platform: read_link(c, f'file_{platform}_link') for platform in ['pc', 'mac']}
+    platforms = [platform for platform, link in links.items() if link and not link.isspace()]
+    update = datetime.strptime(read(c, 'updated_at'), '%m/%d/%Y')
+    return {
+        'id': c['id'],
+        'artist': read(c['artist'], 'name'),
+        'title': read(c, 'title'),
+        'album': read(c, 'album'),
+        'tuning': tunings,
+        'instrument_info': instruments,
+        'parts': parts,
+        'platforms': platforms,
+        'is_official': read_bool('is_official'),
+        'author': read(c['author'], 'name'),
+        'version': read(c, 'version'),
+        'direct_download': read(c, 'file_pc_link'),
+        'download': DOWNLOAD_API.format(c['id']),
+        'info': CDLC_PAGE.format(c['id']),
+        'video': read_link(c, 'music_video_url'),
+        'art': read_link(c, 'album_art_url'),
+        'snapshot_timestamp': int(update.replace(tzinfo=timezone.utc).timestamp()),
+    }
+
+
+def converted(convert, c: dict):
+    try:
+        return convert(c)
+    except Exception as e:
+        return type(e)
+
+
+@pytest.mark.parametrize('key, value', [
+    (key, value)
+    for key in ['lead', 'alt_bass', 'file_pc_link', 'file_mac_link', 'music_video_url', 'has_lyrics', 'is_official']
+    for value in [None, '', ' ', '&nbsp;', '0', 0, 1, True, False, 'yes', 'off', ['x'], 'Drop D &amp; more',
+                  'http://localhost', 'HTTP://localhost', 'https://www.youtube.com/watch?v=ID&list=']
+])
+def test_to_cdlc_same_as_legacy(monkeypatch, key, value):
+    for c in MOCK_CDLC:
+        monkeypatch.setitem(c, key, value)
+        assert_that(converted(To.cdlc, c)).is_equal_to(converted(legacy_cdlc, c))
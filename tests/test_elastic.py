@@ -1,7 +1,12 @@
 from assertpy import assert_that
 from elasticsearch import NotFoundError
+from elasticsearch.helpers import bulk
 
+from sahyun_bot.customsforge import To
 from sahyun_bot.elastic import CustomDLC
+from sahyun_bot.the_loaderer import version
+from sahyun_bot.utils_elastic import domain_counts, domain_example, domain_all, index_domains
+from tests.mock_settings import *
 
 
 def test_properties(es_cdlc):
@@ -60,3 +65,34 @@ def test_random(es_cdlc):
     assert_that(CustomDLC.random('definitely not here')).is_none()
 
     assert_that(CustomDLC.random().id).is_in(65175, 65176)
+
+
+def test_domains(es_cdlc):
+    assert_that(CustomDLC.get(65175).download_domain).is_equal_to('dropbox.com')
+    assert_that(CustomDLC.get(65174).download_domain).is_none()
+
+    assert_that(domain_counts()).is_equal_to({'1drv.ms': 1, 'dropbox.com': 1, 'google.com': 1, 'mediafire.com': 2})
+    assert_that(domain_example('mediafire.com', skip=1)).contains('SM_Moon-Crystal-Power')
+    assert_that(domain_example('mediafire.com', skip=2)).is_none()
+    assert_that(list(domain_all('dropbox.com'))).is_equal_to([CustomDLC.get(65175).link])
+
+
+def test_index_domains(es_cdlc):
+    def without_domains():
+        for cdlc in MOCK_CDLC:
+            c = To.cdlc(cdlc)
+            action = CustomDLC(_id=cdlc['id'], **c).to_dict(include_meta=True)
+            action['_version'] = version(c['snapshot_timestamp'], True)
+            action['_version_type'] = 'external'
+            yield action
+
+    bulk(es_cdlc, without_domains(), refresh=True)
+    versions = {cdlc.id: cdlc.meta.version for cdlc in CustomDLC.search().params(version=True).scan()}
+    assert_that(domain_counts()).is_empty()
+
+    assert_that(index_domains()).is_equal_to(5)  # CDLC #65174 has no direct link
+
+    assert_that({cdlc.id: cdlc.meta.version for cdlc in CustomDLC.search().params(version=True).scan()}) \
+        .is_equal_to(versions)
+    assert_that(domain_counts()).is_equal_to({'1drv.ms': 1, 'dropbox.com': 1, 'google.com': 1, 'mediafire.com': 2})
+    assert_that(index_domains()).is_zero()
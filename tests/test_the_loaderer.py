@@ -1,7 +1,18 @@
+import json
+from datetime import date, timedelta
+from threading import Event
+
+import pytest
 from assertpy import assert_that
+from elasticsearch.helpers import BulkIndexError
 from httmock import HTTMock
 
+from sahyun_bot.customsforge import To, EONS_AGO
 from sahyun_bot.elastic import CustomDLC
+from sahyun_bot.the_loaderer import TheLoaderer, Source, Destination, Pipeline, ElasticIndex, version, epoch_seconds, \
+    FileDump, JsonLinesDump, SqliteDump, SnapshotDump, LoadStats, SourceDiff, AutoIndex, CONTINUOUS_FROM, \
+    AUTO_INDEX_NEVER, AUTO_INDEX_OK, AUTO_INDEX_FAILED, AUTO_INDEX_SKIPPED, bucket_digests
+from tests.mock_settings import *
 from tests.mock_customsforge import customsforge
 
 
@@ -23,3 +34,475 @@ def test_loading_continued(tl):
     hits = list(CustomDLC.search().filter('term', from_auto_index=True).exclude('term', direct_download='fake'))
     # the only updated cdlcs are from the last two days (one each), and the latest cdlc before
     assert_that(hits).is_length(3)
+
+
+def test_loading_incremental(tl):
+    with HTTMock(customsforge):
+        tl.load()
+
+        CustomDLC(_id=65176).update(direct_download='fake')
+        tl.load()
+
+    # the latest cdlc is always read again, but it has not changed since the last load, so it is skipped
+    assert_that(CustomDLC.get(65176).direct_download).is_equal_to('fake')
+
+
+def test_loading_in_bulk(es_cdlc, cf):
+    with HTTMock(customsforge):
+        assert_that(TheLoaderer(cf=cf, use_elastic=True, bulk_size=4, bulk_workers=2).load()).is_true()
+
+    assert_that(list(CustomDLC.search().filter('term', from_auto_index=True))).is_length(6)
+
+
+def test_loading_skips_stale(es_cdlc, cf):
+    loader = TheLoaderer(cf=cf, use_elastic=True, fingerprint_file=None)
+    with HTTMock(customsforge):
+        loader.load('cf', 'es')
+        CustomDLC(_id=65176).update(direct_download='fake')
+        updated = CustomDLC.get(65176).meta.version
+        loader.load('cf', 'es')
+
+    # the document was not overwritten, because its snapshot_timestamp did not change
+    cdlc = CustomDLC.get(65176)
+    assert_that(cdlc.direct_download).is_equal_to('fake')
+    assert_that(cdlc.meta.version).is_equal_to(updated)
+
+
+def test_loading_regains_continuity(es_cdlc):
+    loader = TheLoaderer(use_elastic=True)
+    loader.load(MockCDLCs(), 'es')
+    with pytest.raises(BulkIndexError):
+        loader.load(BrokenCDLCs(), 'es')
+
+    # the documents after the failure lost the flag, but kept their version
+    not_continuous = list(CustomDLC.search().exclude('term', from_auto_index=True))
+    assert_that([cdlc.id for cdlc in not_continuous]).contains_only(65174, 65175, 65176)
+    for cdlc in not_continuous:
+        assert_that(cdlc.meta.version).is_equal_to(version(cdlc.snapshot_timestamp, True))
+
+    loader.load(MockCDLCs(), 'es')
+
+    assert_that(CustomDLC.earliest_not_auto()).is_none()
+    assert_that(list(CustomDLC.search().filter('term', from_auto_index=True))).is_length(6)
+
+
+def test_reading_in_slices(es_cdlc, cf):
+    with HTTMock(customsforge):
+        TheLoaderer(cf=cf, use_elastic=True).load('cf', 'es')
+
+    for continuous in [True, False]:
+        index = ElasticIndex(continuous=continuous, scroll_slices=2)
+        with index:
+            cdlcs = list(index.read_all())
+
+        ids = [cdlc['id'] for cdlc in reversed(MOCK_CDLC)]
+        if continuous:
+            assert_that(cdlcs).extracting('id').is_equal_to(ids)
+        else:
+            assert_that(cdlcs).extracting('id').contains_only(*ids).is_length(6)
+
+
+class Numbers(Source):
+    def __init__(self, count: int):
+        self.count = count
+        self.read = 0
+
+    def read_all(self, *args):
+        for i in range(self.count):
+            self.read += 1
+            yield {'id': i}
+
+
+class Collector(Destination):
+    def __init__(self, fail_at: int = None):
+        self.fail_at = fail_at
+        self.written = []
+
+    def try_write(self, cdlc: dict):
+        if cdlc['id'] == self.fail_at:
+            raise ValueError('Failure as expected')
+
+        self.written.append(cdlc['id'])
+
+
+def test_pipeline():
+    collector = Collector()
+    assert_that(TheLoaderer(pipeline_size=3).load(Numbers(100), collector)).is_true()
+    assert_that(collector.written).is_equal_to(list(range(100)))
+
+
+def test_pipeline_failure():
+    numbers = Numbers(1000)
+    collector = Collector(fail_at=10)
+
+    pipeline = Pipeline(numbers, collector, queue_size=5)
+    with pytest.raises(ValueError):
+        with pipeline:
+            pipeline.join()
+
+    assert_that(collector.written).is_equal_to(list(range(10)))
+    assert_that(numbers.read).is_less_than(1000)  # reading stopped as well
+
+
+class NumberList(Source):
+    def read_all(self, *args):
+        return [{'id': i} for i in range(10)]
+
+
+class NoNumbers(Source):
+    def read_all(self, *args):
+        raise ValueError('Failure as expected')
+
+
+def test_pipeline_list():
+    collector = Collector()
+    assert_that(TheLoaderer(pipeline_size=3).load(NumberList(), collector)).is_true()
+    assert_that(collector.written).is_equal_to(list(range(10)))
+
+
+def test_pipeline_read_failure():
+    collector = Collector()
+    with pytest.raises(ValueError):
+        TheLoaderer(pipeline_size=3).load(NoNumbers(), collector)
+
+    assert_that(collector.written).is_empty()
+
+
+class MockCDLCs(Source):
+    def read_all(self, since: date = None):
+        for cdlc in reversed(MOCK_CDLC):
+            c = To.cdlc(cdlc)
+            c[CONTINUOUS_FROM] = since
+            yield c
+
+
+class BrokenCDLCs(MockCDLCs):
+    def read_all(self, since: date = None):
+        for cdlc in super().read_all(since):
+            if cdlc['id'] == 65173:
+                cdlc['author'] = None
+
+            yield cdlc
+
+
+# CDLC #65174 has no direct link, so it is never dumped
+WITH_LINKS = [65171, 65172, 65173, 65175, 65176]
+
+
+def test_file_dump(tmp_path):
+    file = str(tmp_path / 'dump.json')
+    TheLoaderer().load(MockCDLCs(), FileDump(file))
+
+    dump = FileDump(file)
+    with dump:
+        cdlcs = list(dump.read_all(TEST_DATE - timedelta(days=1)))
+
+    assert_that(cdlcs).extracting('id').is_equal_to([65175, 65176])
+    assert_that(cdlcs).extracting(CONTINUOUS_FROM).contains_only(date.fromisoformat('2010-01-01'))
+
+
+def test_file_dump_in_batches(tmp_path):
+    file = str(tmp_path / 'dump.json')
+    dump = FileDump(file, batch_size=2)
+    with dump:
+        for cdlc in MockCDLCs().read_all(date.fromisoformat('2010-01-01')):
+            dump.try_write(cdlc)
+
+    with open(file, 'r', encoding='utf-8') as f:
+        assert_that(json.load(f)).extracting('id').is_equal_to(WITH_LINKS)
+
+
+def test_file_dump_not_sorted(tmp_path):
+    file = tmp_path / 'dump.json'
+    file.write_text(json.dumps([{**To.cdlc(cdlc), CONTINUOUS_FROM: '2010-01-01'} for cdlc in MOCK_CDLC]))
+
+    dump = FileDump(str(file))
+    with dump:
+        cdlcs = list(dump.read_all())
+
+    assert_that(cdlcs).extracting('id').is_equal_to([cdlc['id'] for cdlc in reversed(MOCK_CDLC)])
+    assert_that([CONTINUOUS_FROM in cdlc for cdlc in cdlcs]).does_not_contain(True)
+
+
+def test_file_dump_not_sorted_since(tmp_path):
+    file = tmp_path / 'dump.json'
+    file.write_text(json.dumps([To.cdlc(cdlc) for cdlc in MOCK_CDLC]))
+
+    dump = FileDump(str(file))
+    with dump:
+        assert_that(list(dump.read_all(TEST_DATE - timedelta(days=1)))).extracting('id').is_equal_to([65175, 65176])
+
+
+def test_sqlite_dump(tmp_path):
+    file = tmp_path / 'dump.db'
+    TheLoaderer().load(MockCDLCs(), str(file))
+
+    dump = SqliteDump(file)
+    with dump:
+        assert_that(list(dump.read_all())).extracting('id').is_equal_to([cdlc['id'] for cdlc in reversed(MOCK_CDLC)])
+
+        cdlcs = list(dump.read_all(TEST_DATE - timedelta(days=1)))
+        assert_that(cdlcs).extracting('id').is_equal_to([65175, 65176])
+        assert_that(cdlcs).extracting(CONTINUOUS_FROM).contains_only(EONS_AGO)
+
+
+def test_sqlite_dump_keeps_newer(tmp_path):
+    file = tmp_path / 'dump.db'
+    dump = SqliteDump(file)
+    with dump:
+        dump.try_write({'id': 1, 'snapshot_timestamp': 1641772800, 'title': 'newer'})
+        dump.try_write({'id': 1, 'snapshot_timestamp': 1641686400, 'title': 'older'})
+
+    with dump:
+        assert_that(list(dump.read_all())).extracting('title').is_equal_to(['newer'])
+
+
+def test_snapshot_dump(tmp_path):
+    file = tmp_path / 'dump.snap'
+    TheLoaderer().load(MockCDLCs(), str(file))
+
+    dump = SnapshotDump(file)
+    with dump:
+        assert_that(list(dump.read_all())).extracting('id').is_equal_to([cdlc['id'] for cdlc in reversed(MOCK_CDLC)])
+        assert_that(list(dump.read_all(TEST_DATE - timedelta(days=1)))).extracting('id').is_equal_to([65175, 65176])
+
+
+class FailingCDLCs(MockCDLCs):
+    def read_all(self, since: date = None):
+        for cdlc in super().read_all(since):
+            if cdlc['id'] == 65173:
+                raise ValueError('Failure as expected')
+
+            yield cdlc
+
+
+def test_snapshot_dump_failed(tmp_path):
+    file = tmp_path / 'dump.snap'
+    TheLoaderer().load(MockCDLCs(), str(file))
+
+    with pytest.raises(ValueError):
+        TheLoaderer(pipeline_size=0).load(FailingCDLCs(), str(file))
+
+    dump = SnapshotDump(file)
+    with dump:
+        assert_that(list(dump.read_all())).extracting('id').is_equal_to([cdlc['id'] for cdlc in reversed(MOCK_CDLC)])
+
+    assert_that(list(tmp_path.iterdir())).is_equal_to([file])
+
+
+class Versions(Source):
+    def __init__(self, *versions):
+        self.versions_read = 0
+        self.__versions = versions
+
+    def read_all(self, since: date = EONS_AGO):
+        raise AssertionError('diff should only read versions')
+
+    def versions(self, since: date = EONS_AGO):
+        self.versions_read += 1
+        yield from ((i, t) for i, t in self.__versions if t >= epoch_seconds(since))
+
+
+def test_diff():
+    same = [(1, 1609459200), (2, 1641772800)]
+    src = Versions(*same, (3, 1641859200), (4, 1641945600), (6, 1641945600))
+    dest = Versions(*same, (3, 1641772800), (5, 1641945600), (6, 1641945600))
+
+    diff = SourceDiff.compare(src, dest, bucket_days=1)
+    assert_that(diff.added).is_equal_to([4])
+    assert_that(diff.changed).is_equal_to([3])
+    assert_that(diff.missing).is_equal_to([5])
+    assert_that(diff.differing).is_equal_to(3)
+    assert_that(src.versions_read).is_equal_to(1)
+
+    assert_that(SourceDiff.compare(Versions(*same), Versions(*reversed(same)))).is_false()
+
+
+def test_diff_dumps(tmp_path):
+    db, snap = str(tmp_path / 'dump.db'), str(tmp_path / 'dump.snap')
+    tl = TheLoaderer()
+    tl.load(MockCDLCs(), [db, snap])
+    assert_that(tl.diff(db, snap)).is_false()
+
+    dump = SqliteDump(db)
+    with dump:
+        dump.try_write({'id': 1, 'snapshot_timestamp': 1641772800})
+
+    assert_that(tl.diff(db, snap).added).is_equal_to([1])
+    assert_that(tl.diff(snap, db).missing).is_equal_to([1])
+
+
+def test_sqlite_dump_digests(tmp_path):
+    db = str(tmp_path / 'dump.db')
+    TheLoaderer().load(MockCDLCs(), db)
+
+    dump = SqliteDump(db)
+    with dump:
+        expected = bucket_digests(dump.versions(), 24 * 60 * 60)
+        assert_that(dump.digests(24 * 60 * 60)).is_equal_to(expected).is_length(6)
+
+
+@pytest.mark.parametrize('name', ['dump.jsonl', 'dump.jsonl.gz'])
+def test_json_lines_dump(tmp_path, name):
+    file = tmp_path / name
+    TheLoaderer().load(MockCDLCs(), str(file))
+    assert_that(str(file) + '.idx').exists()
+
+    dump = JsonLinesDump(file)
+    with dump:
+        assert_that(list(dump.read_all())).extracting('id').is_equal_to(WITH_LINKS)
+
+
+def test_json_lines_dump_skips_blocks(tmp_path):
+    file = tmp_path / 'dump.jsonl.gz'
+    dump = JsonLinesDump(file, block_size=2)
+    with dump:
+        for cdlc in MockCDLCs().read_all(date.fromisoformat('2010-01-01')):
+            dump.try_write(cdlc)
+
+    # the first block should never be read, so breaking it must not matter
+    with open(file, 'r+b') as f:
+        f.write(b'broken')
+
+    with dump:
+        cdlcs = list(dump.read_all(TEST_DATE - timedelta(days=1)))
+
+    assert_that(cdlcs).extracting('id').is_equal_to([65175, 65176])
+    assert_that(cdlcs).extracting(CONTINUOUS_FROM).contains_only(date.fromisoformat('2010-01-01'))
+
+
+def test_json_lines_dump_not_sorted(tmp_path):
+    file = tmp_path / 'dump.jsonl'
+    dump = JsonLinesDump(file, block_size=2)
+    with dump:
+        for cdlc in MOCK_CDLC:
+            dump.try_write(To.cdlc(cdlc))
+
+    with dump:
+        assert_that(list(dump.read_all())).extracting('id').is_equal_to(WITH_LINKS)
+
+
+def test_fan_out(tmp_path):
+    everything = Collector()
+    broken = Collector(fail_at=65172)
+    file = str(tmp_path / 'dump.json')
+
+    with pytest.raises(ValueError):
+        TheLoaderer().load(MockCDLCs(), [everything, broken, FileDump(file, start_from=TEST_DATE - timedelta(days=1))])
+
+    assert_that(everything.written).is_equal_to([cdlc['id'] for cdlc in reversed(MOCK_CDLC)])
+    assert_that(broken.written).is_equal_to([65171])
+    with open(file, 'r', encoding='utf-8') as f:
+        assert_that(json.load(f)).extracting('id').is_equal_to([65175, 65176])
+
+
+class Closing(Collector):
+    def __init__(self):
+        super().__init__()
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class Unreachable(Collector):
+    def __enter__(self):
+        raise ValueError('Failure as expected')
+
+
+def test_fan_out_enter_failure():
+    closing = Closing()
+    with pytest.raises(ValueError):
+        TheLoaderer().load(MockCDLCs(), [closing, Unreachable()])
+
+    assert_that(closing.closed).is_true()
+    assert_that(closing.written).is_empty()
+
+
+class Expecting(Numbers):
+    def expected(self):
+        return self.count
+
+
+def test_load_stats(tmp_path):
+    file = str(tmp_path / 'stats.json')
+    tl = TheLoaderer(stats_file=file)
+    assert_that(tl.load(Expecting(10), Collector())).is_true()
+
+    with open(file, 'r', encoding='utf-8') as f:
+        stats = json.load(f)
+
+    assert_that(stats).contains_entry({'read': 10}, {'written': 10}, {'finished': True}, {'eta_seconds': None})
+
+    assert_that(tl.stats().summary()).starts_with('10 read')
+
+
+def test_load_stats_eta():
+    now = [0]
+    stats = LoadStats(Expecting(10), get_time=lambda: now[0])
+    cdlcs = stats.reading(Expecting(10).read_all())
+
+    next(cdlcs)
+    now[0] = 2
+    next(cdlcs)
+    now[0] = 4
+
+    assert_that(stats.values()).contains_entry({'read': 2}, {'read_per_second': 0.5}, {'eta_seconds': 16})
+
+
+class MockLoaderer:
+    def __init__(self, use_elastic: bool = True, result: bool = True):
+        self.use_elastic = use_elastic
+        self.result = result
+        self.loads = 0
+        self.started = Event()
+        self.proceed = Event()
+        self.proceed.set()
+
+    def load(self):
+        self.loads += 1
+        self.started.set()
+        self.proceed.wait()
+        if isinstance(self.result, Exception):
+            raise self.result
+
+        return self.result
+
+    def stats(self):
+        return None
+
+
+def test_run_now():
+    tl = MockLoaderer()
+    ai = AutoIndex(tl, get_time=lambda: 13)
+    assert_that(ai.status()).contains_entry({'status': AUTO_INDEX_NEVER})
+
+    assert_that(ai.run_now()).is_true()
+    assert_that(ai.status()).contains_entry({'status': AUTO_INDEX_OK}, {'started': 13}, {'finished': 13})
+
+    tl.result = ValueError('Failure as expected')
+    assert_that(ai.run_now()).is_false()
+    assert_that(ai.status()).contains_entry({'status': AUTO_INDEX_FAILED}, {'summary': 'Failure as expected'})
+
+    tl.use_elastic = False
+    assert_that(ai.run_now()).is_false()
+    assert_that(ai.status()).contains_entry({'status': AUTO_INDEX_SKIPPED})
+    assert_that(tl.loads).is_equal_to(2)
+
+
+def test_never_overlaps():
+    tl = MockLoaderer()
+    tl.proceed.clear()
+
+    ai = AutoIndex(tl, interval_minutes=0.0001, jitter=0)
+    ai.start()
+    try:
+        assert_that(tl.started.wait(5)).is_true()
+        assert_that(ai.is_running()).is_true()
+        assert_that(ai.run_now()).is_false()
+        assert_that(ai.describe()).starts_with('CDLCs are being indexed since')
+    finally:
+        tl.proceed.set()
+        ai.close()
+
+    assert_that(ai.is_running()).is_false()
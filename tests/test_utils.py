@@ -1,6 +1,11 @@
+import json
+from io import StringIO
+
+import pytest
 from assertpy import assert_that
 
-from sahyun_bot.utils import identity, clean_link, choose
+from sahyun_bot.utils import identity, clean_link, choose, SpillStack, read_json_array, merge_in_threads, \
+    registered_domain, host_domain, OFFLINE_EXTRACT
 
 
 def test_identity():
@@ -16,7 +21,95 @@ def test_clean_link():
     assert_that(clean_link('http://www.youtube.com/watch?v=ID&playlist=')).is_equal_to('https://youtu.be/ID')
 
 
+def test_registered_domain():
+    assert_that(registered_domain('https://www.mediafire.com/file/dtzfetgjrhh1xn1/file')).is_equal_to('mediafire.com')
+    assert_that(registered_domain('https://drive.google.com/file/d/1wUb2ukepPD9F0V8JeND0kT1kB6kmPJN-/view')) \
+        .is_equal_to('google.com')
+    assert_that(registered_domain('not a link')).is_none()
+    assert_that(registered_domain(' ')).is_none()
+    # noinspection PyTypeChecker
+    assert_that(registered_domain(None)).is_none()
+
+
+def test_registered_domain_cached_by_host():
+    host_domain.cache_clear()
+    registered_domain('https://www.dropbox.com/sh/a?dl=0')
+    registered_domain('https://www.dropbox.com/sh/b?dl=0')
+    registered_domain('www.dropbox.com/sh/c')
+
+    assert_that(host_domain.cache_info().misses).is_equal_to(1)
+    assert_that(host_domain.cache_info().hits).is_equal_to(2)
+
+
+def test_registered_domain_offline():
+    # neither a downloaded nor a cached public suffix list can be used, only the snapshot bundled with tldextract
+    assert_that(OFFLINE_EXTRACT.suffix_list_urls).is_empty()
+    assert_that(OFFLINE_EXTRACT.cache_file).is_empty()
+    assert_that(OFFLINE_EXTRACT.fallback_to_snapshot).is_true()
+
+
 def test_choose():
     assert_that(choose('a', a='x', b='y')).is_equal_to('x')
     assert_that(choose('b', a='x', b='y')).is_equal_to('y')
     assert_that(choose('c', a='x', b='y')).is_none()
+
+
+def test_spill_stack():
+    for chunk_size in [1, 3, 10, 100]:
+        stack = SpillStack(chunk_size=chunk_size)
+        with stack:
+            for i in range(10):
+                stack.push(i)
+
+            assert_that(list(stack.pop_all())).is_equal_to(list(range(9, -1, -1)))
+            assert_that(list(stack.pop_all())).is_empty()
+
+
+def test_spill_stack_resume(tmp_path):
+    file = str(tmp_path / 'spill')
+
+    stack = SpillStack(chunk_size=3, file=file)
+    with stack:
+        for i in range(8):
+            stack.push(i)
+
+        spilled = stack.spilled()
+
+    stack = SpillStack(chunk_size=3, file=file, spilled=spilled)
+    with stack:
+        for i in range(6, 10):
+            stack.push(i)
+
+        assert_that(stack.flush()).is_true()
+        assert_that(stack.flush()).is_false()
+        assert_that(list(stack.pop_all())).is_equal_to(list(range(9, -1, -1)))
+
+
+def test_read_json_array():
+    values = [{'id': 1, 'title': 'Sq[uare], {curly}'}, 'text "quoted"', 123, 4.5e10, None, True, [1, [2]]]
+
+    for chunk_size in [1, 2, 3, 100]:
+        for indent in [None, 4]:
+            f = StringIO(json.dumps(values, indent=indent))
+            assert_that(list(read_json_array(f, chunk_size=chunk_size))).is_equal_to(values)
+
+    assert_that(list(read_json_array(StringIO(' [ ] ')))).is_empty()
+
+    for broken in ['', '{}', '[1,', '[1 2]', '[1,]']:
+        with pytest.raises(ValueError):
+            list(read_json_array(StringIO(broken), chunk_size=2))
+
+
+def test_merge_in_threads():
+    evens, odds = range(0, 100, 2), range(1, 100, 2)
+    assert_that(sorted(merge_in_threads([evens, odds], buffer_size=3))).is_equal_to(list(range(100)))
+    assert_that(list(merge_in_threads([evens, odds], key=identity, buffer_size=3))).is_equal_to(list(range(100)))
+
+
+def test_merge_in_threads_failure():
+    def broken():
+        yield 1
+        raise ValueError('Failure as expected')
+
+    with pytest.raises(ValueError):
+        list(merge_in_threads([broken(), range(10)], key=identity))
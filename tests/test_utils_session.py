@@ -0,0 +1,149 @@
+import base64
+import gzip
+import json
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from threading import Thread
+
+import pytest
+from assertpy import assert_that
+from requests.exceptions import ConnectionError
+
+from sahyun_bot.utils_session import SessionPool, SessionFactory, Cassette, CASSETTE_RECORD, CASSETTE_REPLAY
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_session_reuse():
+    factory = SessionFactory(pool=SessionPool())
+
+    with factory.with_retry(for_url='https://localhost/a') as session:
+        first = session
+
+    with factory.with_retry(for_url='https://localhost/b') as session:
+        assert_that(session).is_same_as(first)
+
+    with factory.with_retry(for_url='https://remotehost') as session:
+        assert_that(session).is_not_same_as(first)
+
+
+def test_sessions_not_shared_while_in_use():
+    factory = SessionFactory(pool=SessionPool())
+
+    with factory.with_retry() as session, factory.with_retry() as other_session:
+        assert_that(session).is_not_same_as(other_session)
+
+
+def test_pool_size():
+    factory = SessionFactory(pool=SessionPool(size=1))
+
+    with factory.with_retry() as other_session, factory.with_retry() as session:
+        pass
+
+    with factory.with_retry() as reused, factory.with_retry() as created:
+        assert_that(reused).is_same_as(session)
+        assert_that(created).is_not_same_as(session).is_not_same_as(other_session)
+
+
+def test_idle_eviction():
+    clock = Clock()
+    factory = SessionFactory(pool=SessionPool(idle_seconds=10, get_time=clock))
+
+    with factory.with_retry() as session:
+        first = session
+
+    clock.now = 5
+    with factory.with_retry() as session:
+        assert_that(session).is_same_as(first)
+
+    clock.now = 15
+    with factory.with_retry() as session:
+        assert_that(session).is_not_same_as(first)
+
+
+def test_cookies_not_kept():
+    factory = SessionFactory(pool=SessionPool())
+
+    with factory.with_retry() as session:
+        session.cookies.set('login', 'value')
+
+    with factory.with_retry() as session:
+        assert_that(session.cookies).is_empty()
+
+
+class CountingHandler(BaseHTTPRequestHandler):
+    calls = 0
+
+    def do_GET(self):
+        CountingHandler.calls += 1
+        if self.path.startswith('/token'):
+            body, content_type = b'{"access_token": "secret", "expires_in": 60}', 'application/json'
+        else:
+            body, content_type = f'Call #{CountingHandler.calls}'.encode('utf-8'), 'text/plain'
+
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Set-Cookie', 'a=1; Path=/')
+        self.send_header('Set-Cookie', 'b=2; Path=/')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def local_url():
+    server = HTTPServer(('127.0.0.1', 0), CountingHandler)
+    Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_port}/'
+    server.shutdown()
+    server.server_close()
+
+
+def test_cassette(local_url, tmp_path):
+    local_url += 'page'
+    directory = str(tmp_path)
+    record = SessionFactory(pool=SessionPool(), cassette=Cassette(CASSETTE_RECORD, directory))
+    replay = SessionFactory(pool=SessionPool(), cassette=Cassette(CASSETTE_REPLAY, directory))
+
+    with record.with_retry(for_url=local_url) as session:
+        recorded = session.get(local_url, params={'x': 1, '_': 1})
+
+    with replay.with_retry(for_url=local_url) as session:
+        replayed = session.get(local_url, params={'_': 2, 'x': 1})  # cache buster & order are ignored
+
+        assert_that(replayed.status_code).is_equal_to(200)
+        assert_that(replayed.text).is_equal_to(recorded.text).is_equal_to('Call #1')
+        assert_that(replayed.cookies.get_dict()).is_equal_to({'a': 'redacted', 'b': 'redacted'})
+
+        with pytest.raises(ConnectionError):
+            session.get(local_url, params={'x': 2})
+
+    assert_that(CountingHandler.calls).is_equal_to(1)
+
+
+def test_cassette_redacts_tokens(local_url, tmp_path):
+    local_url += 'token'
+    directory = str(tmp_path)
+    record = SessionFactory(pool=SessionPool(), cassette=Cassette(CASSETTE_RECORD, directory))
+    replay = SessionFactory(pool=SessionPool(), cassette=Cassette(CASSETTE_REPLAY, directory))
+
+    with record.with_retry(for_url=local_url) as session:
+        assert_that(session.get(local_url).json()).is_equal_to({'access_token': 'secret', 'expires_in': 60})
+
+    with replay.with_retry(for_url=local_url) as session:
+        assert_that(session.get(local_url).json()).is_equal_to({'access_token': 'redacted', 'expires_in': 60})
+
+    for file in tmp_path.iterdir():
+        with gzip.open(file, 'rt', encoding='utf-8') as f:
+            stored = json.load(f)
+
+        assert_that(base64.b64decode(stored['content'])).does_not_contain(b'secret')
+        assert_that(stored['headers']).does_not_contain(['Set-Cookie', 'a=1; Path=/'])